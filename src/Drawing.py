@@ -15,15 +15,31 @@
 '''
 
 # Module for graph drawing and maintenance
-from gi.repository import GooCanvas, Gdk, Pango
+from gi.repository import GooCanvas, Gdk, Pango, GLib
 import networkx as nx
-from textwrap import TextWrapper
-from numpy import mean
+import threading
+from numpy import mean, zeros, concatenate, minimum, maximum, nonzero, unique
 from math import sqrt
+from random import uniform
+from time import time
 from operator import itemgetter, attrgetter
 
 import Errors
 import painters
+import layouts
+
+def _segment_distance(x, y, x1, y1, x2, y2):
+    '''Return how far x, y is from the line segment between x1, y1 and x2, y2.'''
+    dx = x2 - x1
+    dy = y2 - y1
+    
+    #nearest point on the line, clamped to its ends
+    t = 0
+    if dx or dy:
+        t = max(0, min(1, float((x - x1)*dx + (y - y1)*dy) / (dx*dx + dy*dy)))
+    px = x - (x1 + t*dx)
+    py = y - (y1 + t*dy)
+    return sqrt(px*px + py*py)
 
 # Custom canvas class to handle graph drawing and interaction
 class Canvas(GooCanvas.Canvas):
@@ -47,12 +63,76 @@ class Canvas(GooCanvas.Canvas):
         self.mouseover_callback = None
         self.key_handler = None
         self.cboxes = []
-        self.textwrap = TextWrapper(width=8) #text wrapper for node labels
-        self.space = None
+        self.vertices = {} #label -> Vertex, across all SubGraphs
+        self.containers = {} #label -> SubGraph holding that vertex
+        self.lines = {} #frozenset of both end labels -> AggLine
+        self.incident = {} #label -> set of AggLines touching that vertex
+        self.wrap_width = 8 #characters per line of a node label
+        self.positions = {} #where each node was when the last redraw started, in canvas coords
+        self.warm_iterations = 20 #layout iterations used when starting from old positions
+        self.layout_engine = None #name of the layout engine to always use, or None to choose by size
+        self.large_component = 1000 #components with at least this many nodes use the Barnes-Hut layout
+        self.huge_component = 20000 #and those with at least this many use pivot MDS
+        self.parallel_min = 100 #smaller components are laid out in-process instead of in the worker pool
+        self.memo = layouts.memo.ShapeCache(2000) #layouts of small components, reused by shape
+        self.memo_max = 50 #largest component whose layout is memoized
+        self.trivial_max = 10 #trees up to this size are placed directly and share one grid; None to disable
+        self.trivial_spacing = 100 #distance between neighbors in the grid
+        self.grid = None #SubGraph holding the trivial components
+        self.grid_holes = [] #(x, y, width, height) cells of the grid left empty by components that went, for new ones to fill
+        self.packing = None #where each SubGraph was packed, as a layouts.packing.Packing
+        self.virtual_min = 5000 #documents this big only get canvas items for what's on screen; None to disable
+        self.virtual_margin = 200 #pixels around the visible region that get canvas items too
+        self.virtual = False #whether the current drawing is virtualized
+        self.extent = None #(x1, y1, x2, y2) around the whole drawing, as of the last pack
+        self.view_idle = None #pending idle callback that updates which items are on screen
+        self.detail = 'full' #how much vertices and edges show: 'full', 'plain' (no edge text or arrows), or 'dots'
+        self.plain_scale = 0.5 #below this zoom, edges lose their labels and arrowheads
+        self.dots_scale = 0.25 #below this zoom, vertices are drawn as dots and edges as hairlines
+        self.edge_layer_min = 1000 #components with this many edges stroke them all with one EdgeLayer; None to disable
+        self.spare_vertices = {} #label -> Vertex from a component being redrawn, for reuse
+        self.spare_lines = {} #frozenset of both end labels -> AggLine from a component being redrawn, for reuse
+        self.boxes = layouts.spatial.SpatialIndex() #where each SubGraph was packed, for finding what's under the pointer
+        self.hover = None #vertex or edge under the pointer
+        self.band = None #(x, y) in canvas coordinates where a rubber band selection started
+        self.band_rect = None #CanvasRect showing the rubber band, once it's been dragged out
+        self.band_callback = None #called with the list of vertices a rubber band selection caught
+        self.pack_waste = 0.3 #repack from scratch once this much of the packed area is left empty
+        self.background_min = 200 #components this big are refined on a background thread; None to disable
+        self.preview_iterations = 5 #rough layout iterations shown while the real layout runs
+        self.layout_budget = 30 #seconds a background layout may spend refining
+        self.layout_callback = None #called with True when a background layout starts, and False when it stops
+        self.run = None #background layout in progress
+        self.pinned = set() #labels of nodes placed by hand, which relayouts leave where they are
+        self.drag = None #(vertex, pointer x, pointer y, vertex x, vertex y) at the start of a drag
+        self.drag_to = None #where the dragged vertex should be, once it has moved at all
+        self.drag_idle = None #pending idle callback that moves the dragged vertex
+        self.drag_threshold = 3 #pixels the pointer must move before a click becomes a drag
+        self.move_callback = None #called with a vertex that was dragged to a new spot
+        self.frozen = 0 #how many callers have frozen the canvas; see freeze
+        self.frozen_window = None #GdkWindow whose updates we froze, if it was realized
+        self.dirty_vertices = set() #Vertices waiting to be redrawn; see schedule
+        self.dirty_edges = set() #AggLines waiting to be redrawn
+        self.change_idle = None #pending idle callback that redraws whatever's dirty
+        self.build_min = 5000 #redraws with this many nodes to draw build their items a slice at a time; None to disable
+        self.build_slice = 0.02 #seconds each slice of building may take, so input isn't kept waiting
+        self.build = None #item building in progress, a BuildRun
+        self.build_callback = None #called with the fraction built while items are built a slice at a time, and None when done
         self.edge_default_stylesheet = esheet
         self.vertex_default_stylesheet = vsheet
         self.gbox = GooCanvas.CanvasGroup(parent = self.root)
         
+        #what's on screen changes with the zoom and the window size as well as scrolling
+        self.connect("notify::scale", self.update_view)
+        self.connect("notify::scale", self.update_detail)
+        self.connect("size-allocate", self.update_view)
+        
+        #all pointer events go through here, and are handed to items by way of our spatial indexes
+        self.connect("button-press-event", self._on_press)
+        self.connect("motion-notify-event", self._on_motion)
+        self.connect("button-release-event", self._on_release)
+        self.connect("leave-notify-event", self._on_leave)
+        
         #default to a blank stylesheet if none was provided
         #yes, this will cause big drawing errors if you don't bother to populate it
         if esheet == None:
@@ -60,61 +140,659 @@ class Canvas(GooCanvas.Canvas):
         if vsheet == None:
             self.vertex_default_stylesheet = Stylesheet()
     
-    def redraw(self, G):
-        '''Draw the networkx graph G, including new layout.'''
-        #first we clear off the old drawing
-        for c in self.cboxes:
-            c.remove()
-        
-        del self.cboxes[:]
-        
-        #get locations from the graph
-        components = nx.connected_component_subgraphs(G)
-        for subg in components:
-            locations = nx.spring_layout(subg, scale=250*subg.order())
-            cbox = SubGraph(parent = self.gbox, locs=locations, graph=subg)
-            self.cboxes.append(cbox)
-            
-            #iterate over the nodes and draw each according to its given positions
-            for gnode in subg.nodes_iter():
-                nodeobj = G.node[gnode]['node']
-                pos = locations[gnode]
-                lbl_text = self.textwrap.fill(gnode)
+    def redraw(self, G, full=False):
+        '''Draw the networkx graph G, laying out whatever has changed.
+        
+        Components whose structure is the same as in the last drawing keep their
+        layout and canvas items. Changed components are laid out again, seeded
+        with their nodes' last known positions so the picture stays familiar.
+        Set full to throw all of that away and lay out everything from scratch.
+        
+        Trivial components, small trees like isolates and pairs, skip all that
+        and are drawn together in a single grid; see _draw_grid. Only the ones
+        that came or went since the last drawing are placed or taken away.
+        
+        Big components are refined in the background; see _place. When there's
+        a lot to draw, canvas items are built from idle callbacks, and the new
+        components only show up once they're all packed; see BuildRun.'''
+        self.cancel_build()
+        self.freeze()
+        try:
+            #whatever the last redraw left unfinished, we'll pick up again if it's still around
+            unfinished = self.cancel_layout()
+            
+            #changed components are seeded from where their nodes are now
+            if full:
+                self.positions.clear()
+                self.pinned.clear()
+            else:
+                self._store_positions()
+            self.pinned.intersection_update(G)
+            
+            #components drawn the other way can't be kept
+            rebuild = self._set_virtual(G) or full
+            
+            #index the old drawing by node set so that untouched components can be kept
+            old = {}
+            owner = {}
+            for c in self.cboxes:
+                for lbl in c.vertices:
+                    owner[lbl] = c
+                if c is self.grid: continue
+                old[frozenset(c.vertices)] = c
+            
+            kept = []
+            changed = []
+            resume = []
+            trivial = []
+            resized = []
+            for nodes in nx.connected_components(G):
+                if self._is_trivial(G, nodes):
+                    trivial.append(nodes)
+                    continue
                 
-                #initialize background ring for spacing
-                #done before the vertex so it'll be in the background and not interrupt clicking
-                ring = GooCanvas.CanvasEllipse(parent=cbox, fill_color_rgba=0x00000000, stroke_color_rgba=0x00000000)
+                key = frozenset(nodes)
+                cbox = None if rebuild else old.get(key)
+                if cbox is not None and cbox.same_structure(G):
+                    del old[key]
+                    if cbox.sync(G): resized.append(cbox)
+                    kept.append(cbox)
+                    if cbox in unfinished: resume.append(cbox)
+                else:
+                    changed.append(nodes)
+            
+            #a changed component takes over the packing slot of the old one it has the most nodes from
+            heirs = {}
+            claimed = set()
+            for nodes in changed:
+                votes = {}
+                for n in nodes:
+                    if n in owner: votes[owner[n]] = votes.get(owner[n], 0) + 1
+                for c in sorted(votes, key=votes.get, reverse=True):
+                    if c not in claimed and c is not self.grid:
+                        heirs[frozenset(nodes)] = c
+                        claimed.add(c)
+                        break
+            
+            #rosters can put thousands of components in the grid, so only add and take away the ones that came and went
+            grid = self.grid
+            if grid is not None:
+                if not rebuild and trivial:
+                    trivial = self._trim_grid(G, trivial)
+                    grid.sync(G)
+                    resized.append(grid)
+                    kept.append(grid)
+                else:
+                    self._recycle(grid)
+                    self.grid = None
+                    if trivial: heirs[frozenset(n for nodes in trivial for n in nodes)] = grid
+            
+            #anything we didn't keep is out of date, though its items can be reused
+            for c in old.itervalues():
+                self._recycle(c)
+            self.cboxes[:] = kept
+            
+            if self.build_min is not None and sum(len(nodes) for nodes in changed + trivial) >= self.build_min:
+                self.build = BuildRun(self)
+            
+            jobs = []
+            for nodes in changed:
+                subg = G.subgraph(nodes).copy()
+                jobs.append((subg, self._seed(subg)))
+            
+            self._place(G, jobs, resume)
+            if trivial and self.grid is not None:
+                self._extend_grid(G, trivial)
+            elif trivial:
+                self._draw_grid(G, trivial)
+            self.when_built(self._pack_redrawn, rebuild, heirs, resized)
+            self._start_build()
+        finally:
+            self.thaw()
+    
+    def _pack_redrawn(self, rebuild, heirs, resized):
+        '''Pack what redraw drew, handing each changed component its heir's slot.'''
+        self._trim_spares()
+        if rebuild or self.packing is None:
+            self.pack()
+        else:
+            for c in self.cboxes:
+                heir = heirs.get(frozenset(c.vertices))
+                if heir is not None and heir in self.packing.slots:
+                    self.packing.replace(heir, c)
+                    resized.append(c)
+            self.repack(resized)
+    
+    def restore(self, G, locations, offsets):
+        '''Draw G from a saved layout instead of computing a new one.
+        
+        locations maps node labels to (component id, x, y) within that component,
+        and offsets maps component ids to where the component was packed, as
+        produced by get_layout. Components the saved layout doesn't completely
+        describe are laid out as usual, and packed in around the rest.'''
+        self.cancel_build()
+        self.freeze()
+        try:
+            self.cancel_layout()
+            for c in self.cboxes:
+                self._recycle(c)
+            del self.cboxes[:]
+            self.vertices.clear()
+            self.containers.clear()
+            self.lines.clear()
+            self.incident.clear()
+            self.grid = None
+            self.packing = None
+            self.positions.clear()
+            self.pinned.clear()
+            self._set_virtual(G)
+            if self.build_min is not None and G.order() >= self.build_min:
+                self.build = BuildRun(self)
+            
+            used = set()
+            jobs = []
+            trivial = []
+            saved = []
+            for nodes in nx.connected_components(G):
+                if self._is_trivial(G, nodes):
+                    trivial.append(nodes)
+                    continue
                 
-                #TODO assign style info to object based on style rules
-                #   change painter if necessary
-                ngroup = Vertex(nodeobj, parent=cbox, x=pos[0], y=pos[1], painter=painters.vertex.box, text=lbl_text, sheet=self.vertex_default_stylesheet)
-                ngroup.connect("button-press-event", self.node_callback)
-                ngroup.connect("enter-notify-event", self.mouseover_callback, True)
-                ngroup.connect("leave-notify-event", self.mouseover_callback, False)
-                cbox.vertices[ngroup.label] = ngroup
-                cbox.spacers[ngroup.label] = ring
-    
-                #define ring properties
-                coords = ngroup.get_xyr()
-                ring.set_properties(radius_x=coords['radius'], radius_y=coords['radius'], center_x=coords['x'], center_y=coords['y'])
-            
-            #iterate through edges and draw each according to its stored relationships
-            for snode, enode in subg.edges_iter():
-                #get relationship list from original graph to ensure we store references to the correct objects, instead of their copies
-                rels = G[snode][enode]['rels']
-                #TODO assign style info to object based on style rules
-                #   change painter if necessary
-                line = AggLine(parent=cbox, fnode=cbox.vertices[snode], tnode=cbox.vertices[enode], rels=rels, painter=painters.edge.line, sheet=self.edge_default_stylesheet)
-                cbox.edges.append(line)
+                subg = G.subgraph(nodes).copy()
+                ids = set(locations[n][0] if n in locations else None for n in nodes)
+                cid = ids.pop() if len(ids) == 1 else None
+                if cid is None or cid in used or cid not in offsets:
+                    jobs.append((subg, None))
+                    continue
                 
-                line.connect("button-press-event", self.line_callback)
-                line.connect("enter-notify-event", self.mouseover_callback, True)
-                line.connect("leave-notify-event", self.mouseover_callback, False)
+                used.add(cid)
+                locs = dict((n, locations[n][1:]) for n in nodes)
+                cbox = self._draw_component(G, subg, locs)
+                x, y = offsets[cid]
+                cbox.set_properties(x=x, y=y)
+                saved.append(cbox)
+            
+            #trivial components were saved together as one grid, unless the file predates it
+            if trivial:
+                members = [n for nodes in trivial for n in nodes]
+                ids = set(locations[n][0] if n in locations else None for n in members)
+                cid = ids.pop() if len(ids) == 1 else None
+                if cid is None or cid in used or cid not in offsets:
+                    self._draw_grid(G, trivial)
+                else:
+                    locs = dict((n, locations[n][1:]) for n in members)
+                    grid = self._draw_grid(G, trivial, locs)
+                    x, y = offsets[cid]
+                    grid.set_properties(x=x, y=y)
+                    saved.append(grid)
+            
+            if jobs:
+                self._place(G, jobs)
+            self.when_built(self._pack_restored, saved)
+            self._start_build()
+        finally:
+            self.thaw()
+    
+    def _pack_restored(self, saved):
+        '''Pack what restore drew around the SubGraphs in saved, which were put back where they were.'''
+        #whatever the file placed stays put, and the rest fills in around it
+        if saved:
+            self.packing = layouts.packing.Packing()
+            for c in saved:
+                #cancel_build drops whatever it didn't get to
+                if c.get_parent() is None: continue
+                
+                x, y = self._box_position(c)
+                w, h = self._box_size(c)
+                self.packing.adopt(c, x, y, w, h)
+        
+        self._trim_spares()
+        self.repack()
+    
+    def get_layout(self):
+        '''Describe the current drawing in the form taken by restore.'''
+        locations = {}
+        offsets = {}
+        for cid, subg in enumerate(self.cboxes):
+            offsets[cid] = (subg.get_property('x'), subg.get_property('y'))
+            for lbl, v in subg.vertices.iteritems():
+                locations[lbl] = (cid, v.x, v.y)
+        
+        return (locations, offsets)
+    
+    def cancel_layout(self):
+        '''Stop refining layouts in the background.
+        Returns the set of SubGraphs whose layout hadn't finished.'''
+        run = self.run
+        if run is None:
+            return set()
+        
+        self.run = None
+        run.cancel()
+        if self.layout_callback != None: self.layout_callback(False)
+        
+        return run.pending
+    
+    def _place(self, G, jobs, resume=()):
+        '''Lay out and draw each (subg, seed) pair in jobs.
+        
+        Small components are laid out before they're drawn. Big ones are drawn
+        right away at their seed positions, or after a few rough iterations if
+        they don't have any, and then refined on a background thread. The
+        SubGraphs in resume, already drawn, are refined along with them.'''
+        now = []
+        later = []
+        for subg, seed in jobs:
+            if self.background_min is not None and subg.order() >= self.background_min:
+                later.append((subg, seed))
+            else:
+                now.append((subg, seed))
+        
+        for (subg, seed), locations in zip(now, self._layout_all(now)):
+            self._draw_component(G, subg, locations)
+        
+        refine = []
+        for subg, seed in later:
+            name, kwargs = self._pick_layout(subg, seed)
+            if seed is None and name in layouts.parallel.PROGRESSIVE:
+                #the engine will report back soon enough, so start from anywhere
+                seed = layouts.util.scatter(subg, kwargs['scale'])
+            elif seed is None:
+                seed = layouts.barneshut.layout(subg, scale=kwargs['scale'], iterations=self.preview_iterations)
+                kwargs['pos'] = seed
+            cbox = self._draw_component(G, subg, seed)
+            refine.append((cbox, name, kwargs))
+        
+        for cbox in resume:
+            name, kwargs = self._pick_layout(cbox.G, cbox.get_locations())
+            refine.append((cbox, name, kwargs))
+        
+        #there's no point refining what hasn't been built yet
+        if refine:
+            self.when_built(self._refine, refine)
+    
+    def _refine(self, jobs):
+        '''Start refining each (SubGraph, engine name, engine args) in jobs in the background.'''
+        #cancel_build drops whatever it didn't get to
+        jobs = [job for job in jobs if job[0].get_parent() is not None]
+        if not jobs:
+            return
+        
+        self.run = LayoutRun(self, jobs, self.layout_budget)
+        self.run.start()
+        if self.layout_callback != None: self.layout_callback(True)
+    
+    def _layout_finished(self, run):
+        '''Called by run when it has nothing left to do.'''
+        if self.run is run:
+            self.run = None
+            if self.layout_callback != None: self.layout_callback(False)
+    
+    def cancel_build(self):
+        '''Stop building items a slice at a time, and pack whatever was finished.
+        Components that weren't are left out until the next redraw.'''
+        run = self.build
+        if run is None:
+            return
+        
+        run.cancel()
+        unbuilt = set(cbox for count, cbox, steps in run.jobs)
+        for cbox in unbuilt:
+            self._unindex(cbox)
+            cbox.remove()
+        self.cboxes[:] = [c for c in self.cboxes if c not in unbuilt]
+        if self.grid in unbuilt:
+            self.grid = None
         
-        self.pack()
+        self._build_finished(run)
+    
+    def _start_build(self):
+        '''Start building whatever _draw_component queued up, if anything.'''
+        if self.build is not None:
+            self.build.start()
+    
+    def when_built(self, func, *args):
+        '''Call func with args once the items being built a slice at a time are done and packed,
+        or right away if nothing is being built. Anything wanting a vertex or edge just after
+        a redraw should go through here, since a big drawing can take a while to get to it.'''
+        if self.build is None:
+            func(*args)
+        else:
+            self.build.after.append((func, args))
+    
+    def _build_finished(self, run):
+        '''Called when run has built everything it's going to. Do what was waiting on it.'''
+        self.build = None
+        self.freeze()
+        try:
+            for func, args in run.after:
+                func(*args)
+            for cbox in run.built:
+                cbox.set_property('visibility', GooCanvas.CanvasItemVisibility.VISIBLE)
+        finally:
+            self.thaw()
+        if self.build_callback != None: self.build_callback(None)
+    
+    def _layout_all(self, jobs):
+        '''Lay out each (subg, seed) pair in jobs, returning a list of locations.
+        
+        Big components go to the worker pool while small ones, which aren't worth
+        the trip, are handled here in the meantime.'''
+        big = [i for i, (subg, seed) in enumerate(jobs) if subg.order() >= self.parallel_min]
+        pool = layouts.parallel.get_pool() if len(big) > 1 else None
+        
+        pending = None
+        if pool is not None:
+            tasks = []
+            for i in big:
+                subg, seed = jobs[i]
+                name, kwargs = self._pick_layout(subg, seed)
+                tasks.append(layouts.parallel.make_task(name, subg, kwargs))
+            pending = pool.map_async(layouts.parallel.run, tasks)
+        
+        results = [None] * len(jobs)
+        for i, (subg, seed) in enumerate(jobs):
+            if pending is None or subg.order() < self.parallel_min:
+                results[i] = self._layout(subg, seed)
+        
+        if pending is not None:
+            for i, locations in zip(big, pending.get()):
+                results[i] = locations
+        
+        return results
+    
+    def _layout(self, subg, seed=None):
+        '''Lay out component subg in-process, reusing the layout of a same-shaped component if we can.'''
+        name, kwargs = self._pick_layout(subg, seed)
+        
+        #seeded layouts depend on more than shape, so they can't be shared
+        shape = None
+        if seed is None and subg.order() <= self.memo_max:
+            shape = layouts.memo.Shape(subg)
+            locations = self.memo.get(shape, name)
+            if locations is not None:
+                return locations
+        
+        locations = layouts.parallel.ENGINES[name](subg, **kwargs)
+        
+        if shape is not None:
+            self.memo.put(shape, locations, name)
+        return locations
+    
+    def _pick_layout(self, subg, seed=None):
+        '''Choose a layout engine for component subg. Returns its name and arguments.'''
+        name = self.layout_engine
+        if name is None:
+            if subg.order() >= self.huge_component:
+                name = 'pivotmds'
+            elif subg.order() >= self.large_component:
+                name = 'barneshut'
+            else:
+                name = 'spring'
+        
+        kwargs = {'scale': 250*subg.order()}
+        if seed is not None:
+            kwargs['pos'] = seed
+            #pivot MDS skips straight to its few stress passes when seeded
+            if name != 'pivotmds': kwargs['iterations'] = self.warm_iterations
+            
+            #hand-placed nodes stay put, and the rest is laid out around them
+            fixed = [n for n in subg if n in self.pinned and n in seed]
+            if fixed: kwargs['fixed'] = fixed
+        
+        return (name, kwargs)
+    
+    def _is_trivial(self, G, nodes):
+        '''Determine whether the component made of nodes belongs in the grid.'''
+        if self.trivial_max is None:
+            return False
+        #the grid places its components itself, which would undo hand placement
+        for n in nodes:
+            if n in self.pinned: return False
+        return layouts.trivial.is_trivial(G, nodes, self.trivial_max)
+    
+    def _draw_grid(self, G, components, locations=None):
+        '''Draw the trivial components, each a list of nodes, in one shared SubGraph.
+        
+        They're placed in closed form by layouts.trivial unless locations are given.
+        This saves a layout run, a CanvasGroup and a packing step per component,
+        which adds up for rosters with thousands of isolates.'''
+        subg = G.subgraph([n for nodes in components for n in nodes]).copy()
+        if locations is None:
+            locations = layouts.trivial.grid(subg, components, self.trivial_spacing)
+        
+        self.grid = self._draw_component(G, subg, locations)
+        self.grid_holes = []
+        return self.grid
+    
+    def _trim_grid(self, G, components):
+        '''Take the trivial components that are gone from G off the grid, keeping their items to reuse.
+        Returns those of components, each a list of nodes, that the grid doesn't have yet.'''
+        grid = self.grid
+        wanted = dict((frozenset(nodes), nodes) for nodes in components)
+        for nodes in list(nx.connected_components(grid.G)):
+            key = frozenset(nodes)
+            #two trees on the same nodes with the same number of edges match if one's edges are all in the other
+            if key in wanted and all(G.has_edge(u, v) for u, v in grid.G.edges_iter(nodes)):
+                del wanted[key]
+                continue
+            
+            self.grid_holes.append(layouts.trivial.cell(grid.locations, nodes, self.trivial_spacing))
+            for n in nodes:
+                v = grid.vertices[n]
+                for e in list(v.edges):
+                    self._drop_edge(grid, e)
+                self._drop_vertex(grid, v)
+                del grid.locations[n]
+            grid.G.remove_nodes_from(nodes)
+        
+        return wanted.values()
+    
+    def _extend_grid(self, G, components):
+        '''Add the trivial components, each a list of nodes, to the grid without moving what's already on it.'''
+        grid = self.grid
+        subg = G.subgraph([n for nodes in components for n in nodes]).copy()
+        cells = [layouts.trivial.cell(grid.locations, nodes, self.trivial_spacing) for nodes in nx.connected_components(grid.G)]
+        grid.locations.update(layouts.trivial.extend(subg, components, cells, self.grid_holes, self.trivial_spacing))
+        grid.G.add_nodes_from(subg.nodes_iter(data=True))
+        grid.G.add_edges_from(subg.edges_iter(data=True))
+        
+        steps = self._build_items(G, subg, grid)
+        if self.build is not None:
+            self.build.add(grid, steps, subg.order() + subg.number_of_edges())
+        else:
+            for step in steps: pass
+    
+    def _drop_vertex(self, cbox, v):
+        '''Take v off cbox and out of our lookup tables, keeping it to reuse unless it's selected.'''
+        cbox.remove_vertex(v)
+        if self.vertices.get(v.label) is v:
+            del self.vertices[v.label]
+            del self.containers[v.label]
+            del self.incident[v.label]
+        if not v.selected: self.spare_vertices[v.label] = v
+    
+    def _drop_edge(self, cbox, e):
+        '''Take e off cbox and out of our lookup tables, keeping it to reuse unless it's selected.'''
+        cbox.remove_edge(e)
+        key = frozenset((e.origin.label, e.dest.label))
+        if self.lines.get(key) is e:
+            del self.lines[key]
+        if not e.selected: self.spare_lines[key] = e
+    
+    def _draw_component(self, G, subg, locations):
+        '''Create the SubGraph and canvas items for component subg at the given locations.
+        
+        When virtualized, vertices and edges are made but left off the canvas;
+        update_view puts them on it once they're in sight. While a BuildRun is
+        collecting work, the SubGraph is made right away but stays hidden, and
+        its items are built later.'''
+        cbox = SubGraph(parent = self.gbox, locs=locations, graph=subg, virtual=self.virtual)
+        self.cboxes.append(cbox)
+        
+        steps = self._build_items(G, subg, cbox)
+        if self.build is not None:
+            cbox.set_property('visibility', GooCanvas.CanvasItemVisibility.INVISIBLE)
+            self.build.add(cbox, steps, subg.order() + subg.number_of_edges())
+        else:
+            for step in steps: pass
+        return cbox
+    
+    def _build_items(self, G, subg, cbox):
+        '''Generator. Create the vertices and edges of component subg in cbox, yielding after each one.'''
+        home = None if self.virtual else cbox
+        
+        #iterate over the nodes and draw each according to its given positions
+        for gnode in subg.nodes_iter():
+            nodeobj = G.node[gnode]['node']
+            pos = cbox.locations[gnode]
+            lbl_text = painters.text.cache.wrap(gnode, self.wrap_width)
+            
+            #TODO assign style info to object based on style rules
+            #   change painter if necessary
+            ngroup = self.spare_vertices.pop(gnode, None)
+            if ngroup is not None:
+                #reuse the old vertex instead of making a new one
+                ngroup.recycle(nodeobj, x=pos[0], y=pos[1], text=lbl_text, sheet=self.vertex_default_stylesheet, detail=self.detail)
+                if home is not None: home.add_child(ngroup, -1)
+                ngroup.draw()
+            else:
+                ngroup = Vertex(nodeobj, parent=home, x=pos[0], y=pos[1], painter=painters.vertex.box, text=lbl_text, sheet=self.vertex_default_stylesheet, detail=self.detail)
+            cbox.add_vertex(ngroup)
+            self._index_vertex(cbox, ngroup)
+            yield ngroup
+        
+        #big components stroke every edge with one item instead of a group apiece
+        layer = cbox.layer
+        if layer is None and self.edge_layer_min is not None and subg.number_of_edges() >= self.edge_layer_min:
+            layer = EdgeLayer(parent=cbox, sheet=self.edge_default_stylesheet)
+            layer.detail = self.detail
+            cbox.layer = layer
+        
+        #iterate through edges and draw each according to its stored relationships
+        for snode, enode in subg.edges_iter():
+            #get relationship list from original graph to ensure we store references to the correct objects, instead of their copies
+            rels = G[snode][enode]['rels']
+            
+            #reuse the old edge instead of making a new one
+            line = self.spare_lines.pop(frozenset((snode, enode)), None)
+            if line is not None:
+                line.recycle(cbox.vertices[snode], cbox.vertices[enode], rels, sheet=self.edge_default_stylesheet, detail=self.detail, layer=layer)
+                if home is not None and layer is None: home.add_child(line, -1)
+                line.draw()
+                cbox.add_edge(line)
+                self._index_edge(line)
+                yield line
+                continue
+            
+            #TODO assign style info to object based on style rules
+            #   change painter if necessary
+            if layer is not None:
+                line = AggLine(fnode=cbox.vertices[snode], tnode=cbox.vertices[enode], rels=rels, painter=painters.edge.line, sheet=self.edge_default_stylesheet, detail=self.detail, layer=layer)
+                cbox.add_edge(line)
+                self._index_edge(line)
+                yield line
+                continue
+            
+            line = AggLine(parent=home, fnode=cbox.vertices[snode], tnode=cbox.vertices[enode], rels=rels, painter=painters.edge.line, sheet=self.edge_default_stylesheet, detail=self.detail)
+            cbox.add_edge(line)
+            self._index_edge(line)
+            yield line
+    
+    def _recycle(self, cbox):
+        '''Take cbox off the canvas, keeping its vertices and edges for _draw_component to reuse.
+        Selected ones aren't kept, since whoever selected them still has them.'''
+        self._unindex(cbox)
+        
+        #a build done a slice at a time can keep the next pack waiting, so stop finding it under the pointer now
+        if cbox in self.boxes: self.boxes.remove(cbox)
+        for lbl, v in cbox.vertices.iteritems():
+            if not v.selected: self.spare_vertices[lbl] = v
+        for e in cbox.edges:
+            if not e.selected: self.spare_lines[frozenset((e.origin.label, e.dest.label))] = e
+        cbox.remove()
+    
+    def _trim_spares(self):
+        '''Let go of whatever _recycle kept that nothing reused.'''
+        self.spare_vertices.clear()
+        self.spare_lines.clear()
+    
+    def _index_vertex(self, cbox, v):
+        '''Add v, one of cbox's vertices, to our lookup tables.'''
+        self.vertices[v.label] = v
+        self.containers[v.label] = cbox
+        self.incident[v.label] = v.edges
+    
+    def _index_edge(self, e):
+        '''Add e to our lookup tables.'''
+        self.lines[frozenset((e.origin.label, e.dest.label))] = e
+    
+    def _unindex(self, cbox):
+        '''Drop cbox's vertices and edges from our lookup tables, unless they've been replaced already.'''
+        for lbl, v in cbox.vertices.iteritems():
+            if self.vertices.get(lbl) is v:
+                del self.vertices[lbl]
+                del self.containers[lbl]
+                del self.incident[lbl]
+        for e in cbox.edges:
+            key = frozenset((e.origin.label, e.dest.label))
+            if self.lines.get(key) is e:
+                del self.lines[key]
+    
+    def _relabel(self, oldlbl, newlbl):
+        '''Move our lookup table entries for a vertex from oldlbl to newlbl.'''
+        v = self.vertices.pop(oldlbl)
+        self.vertices[newlbl] = v
+        self.containers[newlbl] = self.containers.pop(oldlbl)
+        self.incident[newlbl] = self.incident.pop(oldlbl)
+        
+        for e in v.edges:
+            other = e.dest if e.origin is v else e.origin
+            self.lines.pop(frozenset((oldlbl, other.label)), None)
+            self.lines[frozenset((newlbl, other.label))] = e
+    
+    def _seed(self, subg):
+        '''Build starting positions for subg from where its nodes were last drawn.
+        
+        Nodes we haven't drawn before start out next to their drawn neighbors.
+        Returns None if none of subg has been drawn yet.'''
+        seed = {}
+        for n in subg:
+            if n in self.positions:
+                seed[n] = self.positions[n]
+        
+        if not seed:
+            return None
+        
+        cx = mean([p[0] for p in seed.itervalues()])
+        cy = mean([p[1] for p in seed.itervalues()])
+        for n in subg:
+            if n in seed: continue
+            
+            near = [self.positions[m] for m in subg[n] if m in self.positions]
+            if near:
+                x = mean([p[0] for p in near])
+                y = mean([p[1] for p in near])
+            else:
+                x, y = cx, cy
+            
+            #jitter so that newcomers sharing a neighbor don't start on top of each other
+            seed[n] = (x + uniform(-100, 100), y + uniform(-100, 100))
+        
+        return seed
+    
+    def _store_positions(self):
+        '''Remember where every vertex is now, in canvas coordinates.'''
+        self.positions.clear()
+        for subg in self.cboxes:
+            ox = subg.get_property('x')
+            oy = subg.get_property('y')
+            for lbl, v in subg.vertices.iteritems():
+                self.positions[lbl] = (v.x + ox, v.y + oy)
         
     def refresh(self, obj, data = None):
-        '''Update visuals without calculating a new layout.'''
+        '''Update visuals without calculating a new layout.
+        Bookkeeping is done right away, but drawing waits; see schedule.'''
         if obj.type == "node":
             subg = None
             if not data == None:
@@ -122,162 +800,466 @@ class Canvas(GooCanvas.Canvas):
                 # the subgraph needs to do some rejiggering.
                 subg = self.get_container(data)
                 subg.refresh_node(obj.label, data)
+                self._relabel(data, obj.label)
+                if data in self.positions:
+                    self.positions[obj.label] = self.positions.pop(data)
+                if data in self.pinned:
+                    self.pinned.remove(data)
+                    self.pinned.add(obj.label)
             
-            #redraw vertex and all edges touching it
-            v = self.get_vertex(obj.label)
-            
-            #update vertex data
             #v.node is a reference, and that object has already been updated
+            v = self.get_vertex(obj.label)
             v.label = v.node.label
-            v.text = self.textwrap.fill(v.label)
-            
-            v.draw()
-            if not subg == None: subg.add_spacer(v.label) #rejigger spacer
-            #redraw all adjacent edges
-            for e in self.get_edges(obj.label):
-                e.draw()
+            self.schedule(vertex=v)
         elif obj.type == "rel":
-            #redraw edge
             e = self.get_edge(obj.from_node, obj.to_node)
             if data == "deleted":
                 e.remove_rel(obj)
             else:
                 e.add_rel(obj)
-            e.draw()
+            self.schedule(edge=e)
+    
+    def schedule(self, vertex=None, edge=None):
+        '''Mark a Vertex or an AggLine as needing to be redrawn.
+        
+        Work is put off until the main loop is idle, so a burst of edits, like
+        typing a new label, costs a single pass; see _apply_changes.'''
+        if vertex is not None: self.dirty_vertices.add(vertex)
+        if edge is not None: self.dirty_edges.add(edge)
+        if self.change_idle is None:
+            self.change_idle = GLib.idle_add(self._apply_changes)
+    
+    def flush(self):
+        '''Apply scheduled changes now instead of waiting for the main loop.'''
+        if self.change_idle is not None:
+            GLib.source_remove(self.change_idle)
+        self._apply_changes()
+    
+    def _apply_changes(self):
+        '''Idle callback for schedule. Redraw everything dirty, then repack once.'''
+        self.change_idle = None
+        vertices = self.dirty_vertices
+        edges = self.dirty_edges
+        self.dirty_vertices = set()
+        self.dirty_edges = set()
+        
+        self.freeze()
+        try:
+            changed = set()
+            for v in vertices:
+                #anything deleted or redrawn away since it was scheduled is left alone
+                if self.vertices.get(v.label) is not v: continue
+                
+                v.text = painters.text.cache.wrap(v.label, self.wrap_width)
+                v.draw()
+                edges.update(self.get_edges(v.label))
+                cbox = self.get_container(v.label)
+                cbox.track_vertex(v)
+                changed.add(cbox)
             
-    def pack(self):
-        '''Pack component subgraphs into the drawing space.'''
-        if len(self.cboxes) == 0:
+            for e in edges:
+                if self.lines.get(frozenset((e.origin.label, e.dest.label))) is e: e.draw()
+            
+            #new labels can change the components' sizes
+            if changed: self.repack(changed)
+        finally:
+            self.thaw()
+        return False
+    
+    def freeze(self):
+        '''Stop working out the canvas bounds and repainting the window until thaw.
+        
+        Calls nest, so each freeze needs its own thaw. Meanwhile item changes
+        only pile up, and the bounds and picture are brought up to date once.'''
+        self.frozen += 1
+        if self.frozen > 1:
             return
         
-        del self.space
+        self.set_properties(automatic_bounds=False)
+        self.frozen_window = self.get_window()
+        if self.frozen_window is not None: self.frozen_window.freeze_updates()
+    
+    def thaw(self):
+        '''Undo a freeze, updating the canvas once the last one is undone.'''
+        self.frozen -= 1
+        if self.frozen > 0:
+            return
         
-        #figure out the maximum possible dimensions by layout all our subgraphs end-to-end
-        tog = 0
-        worst_w = 0
-        worst_h = 0
-        boxes = []
+        #virtualized drawings set their own bounds
+        self.set_properties(automatic_bounds=not self.virtual)
+        self.request_update()
+        if self.frozen_window is not None: self.frozen_window.thaw_updates()
+        self.frozen_window = None
+    
+    def pack(self):
+        '''Pack component subgraphs into the drawing space from scratch.'''
+        sizes = {}
         for subg in self.cboxes:
-            bounds = subg.get_bounds()
-            h = bounds.y2 - bounds.y1
-            w = bounds.x2 - bounds.x1
-            boxes.append((w*h, subg, w, h))
-            
-            #add each box to either the width or height of the max bounds
-            #this ensures relatively sane packing behavior
-            worst_w = max(worst_w, w)
-            worst_h = max(worst_h, h)
-            if tog:
-                worst_w += max(w, h)
+            sizes[subg] = self._box_size(subg)
+        
+        self.packing = layouts.packing.Packing(sizes)
+        for subg in self.cboxes:
+            self._move_box(subg, *self.packing.position(subg))
+        
+        self._update_extent()
+    
+    def repack(self, changed=()):
+        '''Bring the packing up to date without moving more than we have to.
+        
+        New SubGraphs are fitted in around the rest, and only those in changed
+        are measured again. A component that grew past its slot stays where it
+        is, and just the neighbors it now overlaps are moved out of its way.
+        Everything in changed is lined up with its slot again, since a new
+        layout or an inherited slot doesn't start where the old drawing was.'''
+        if self.packing is None:
+            return self.pack()
+        
+        current = set(self.cboxes)
+        for subg in self.packing.slots.keys():
+            if subg not in current: self.packing.remove(subg)
+        
+        moved = {}
+        fresh = [(self._box_size(subg), subg) for subg in self.cboxes if subg not in self.packing.slots]
+        for (w, h), subg in sorted(fresh, key=lambda f: (f[0][1], f[0][0]), reverse=True):
+            moved[subg] = self.packing.add(subg, w, h)
+        
+        for subg in changed:
+            if subg in current and subg not in moved:
+                moved.update(self.packing.resize(subg, *self._box_size(subg)))
+                moved[subg] = self.packing.position(subg)
+        
+        #all those holes add up, so every so often start over
+        if self.packing.waste() > self.pack_waste:
+            return self.pack()
+        
+        for subg, (x, y) in moved.iteritems():
+            self._move_box(subg, x, y)
+        
+        self._update_extent()
+    
+    def _box_size(self, subg):
+        '''Measure the width and height of a SubGraph.'''
+        x1, y1, x2, y2 = subg.get_extent()
+        return (x2 - x1, y2 - y1)
+    
+    def _box_position(self, subg):
+        '''Return where subg's packing slot starts, in canvas coordinates.'''
+        x1, y1, x2, y2 = subg.get_extent()
+        return (subg.get_property('x') + x1, subg.get_property('y') + y1)
+    
+    def _move_box(self, subg, x, y):
+        '''Put subg in the packing slot starting at x, y.
+        
+        Layouts aren't anchored at their own origin, and pinned vertices keep
+        whatever coordinates they were dropped at, so line up the extent rather
+        than the SubGraph's x and y.'''
+        x1, y1, x2, y2 = subg.get_extent()
+        subg.set_properties(x=x - x1, y=y - y1)
+    
+    def _set_virtual(self, G):
+        '''Decide whether drawing G should be virtualized. Returns whether that changed.'''
+        virtual = self.virtual_min is not None and G.order() >= self.virtual_min
+        if virtual == self.virtual:
+            return False
+        
+        #the canvas can't work out its own bounds from items that aren't there
+        self.virtual = virtual
+        self.extent = None
+        if not self.frozen: self.set_properties(automatic_bounds=not virtual)
+        return True
+    
+    def _update_extent(self):
+        '''Work out the box around the whole drawing.
+        When virtualized, size the canvas to fit it and bring what's on screen up to date.'''
+        extent = None
+        self.boxes = layouts.spatial.SpatialIndex()
+        for subg in self.cboxes:
+            x, y = self._box_position(subg)
+            w, h = self._box_size(subg)
+            self.boxes.insert(subg, (x, y, x + w, y + h))
+            if extent is None:
+                extent = [x, y, x + w, y + h]
             else:
-                worst_h += max(w, h)
-            tog = not tog
+                extent = [min(extent[0], x), min(extent[1], y), max(extent[2], x + w), max(extent[3], y + h)]
         
-        #sort the subgraphs by size
-        keys = sorted(boxes, reverse=True)
+        if extent is None:
+            extent = [0, 0, 0, 0]
+        self.extent = tuple(extent)
+        if not self.virtual:
+            return
         
-        #pack each individually
-        self.space = Packer(0, 0, worst_w, worst_h)
-        for key, subg, w, h in keys:
-            (x, y) = self.space.place(w, h)
-            subg.set_properties(x=x, y=y)
+        pad = self.get_property('bounds_padding')
+        self.set_bounds(extent[0] - pad, extent[1] - pad, extent[2] + pad, extent[3] + pad)
+        self.update_view()
     
-    def get_vertex(self, label):
-        '''Find vertex object by label.'''
+    def update_detail(self, *args):
+        '''Event handler and standalone. Pick the level of detail for the current zoom.
+        
+        Items are repainted when it changes, but stay the same size and in the
+        same place, so nothing needs laying out again.'''
+        scale = self.get_scale()
+        if scale < self.dots_scale:
+            detail = 'dots'
+        elif scale < self.plain_scale:
+            detail = 'plain'
+        else:
+            detail = 'full'
+        
+        if detail == self.detail:
+            return
+        
+        self.detail = detail
+        for v in self.vertices.itervalues():
+            v.detail = detail
+            #anything off the canvas gets painted the new way when it shows up
+            if v.get_parent() is not None: v.draw()
+        for e in self.lines.itervalues():
+            e.detail = detail
+            if e.layer is None or e.get_parent() is not None: e.draw()
         for subg in self.cboxes:
-            if label in subg.vertices:
-                return subg.vertices[label]
+            if subg.layer is not None:
+                subg.layer.detail = detail
+                subg.layer.changed(False)
+    
+    def update_view(self, *args):
+        '''Event handler and standalone. Put what's on screen on the canvas, and take off what isn't.
         
-        return None
+        This only matters when virtualized. Work is put off until the main loop
+        is idle, so a burst of scrolling costs a single update.'''
+        if self.virtual and self.view_idle is None:
+            self.view_idle = GLib.idle_add(self._update_view)
     
-    def get_edge(self, tlbl, flbl):
-        '''Find the edge between nodes tlbl and flbl.'''
+    def _update_view(self):
+        '''Idle callback for update_view.'''
+        self.view_idle = None
+        if not self.virtual:
+            return False
+        
+        hadj = self.get_hadjustment()
+        vadj = self.get_vadjustment()
+        if hadj is None or vadj is None:
+            return False
+        
+        m = self.virtual_margin
+        x1, y1 = self.convert_from_pixels(hadj.get_value() - m, vadj.get_value() - m)
+        x2, y2 = self.convert_from_pixels(hadj.get_value() + hadj.get_page_size() + m, vadj.get_value() + vadj.get_page_size() + m)
+        
         for subg in self.cboxes:
-            #pick the right box
-            if tlbl in subg.vertices and flbl in subg.vertices:
-                #test every edge
-                for edge in subg.edges:
-                    if edge.spans(tlbl, flbl): return edge
+            ox = subg.get_property('x')
+            oy = subg.get_property('y')
+            ex1, ey1, ex2, ey2 = subg.get_extent()
+            if ex1 + ox <= x2 and x1 <= ex2 + ox and ey1 + oy <= y2 and y1 <= ey2 + oy:
+                subg.show_region((x1 - ox, y1 - oy, x2 - ox, y2 - oy))
+            elif subg.shown:
+                subg.show_region(None)
         
-        return None
+        return False
+    
+    def get_vertex(self, label):
+        '''Find vertex object by label.
+        When virtualized, this puts it on the canvas if it wasn't already.'''
+        v = self.vertices.get(label)
+        if v is not None and self.virtual:
+            self.containers[label].reveal(v)
+        return v
+    
+    def get_edge(self, tlbl, flbl):
+        '''Find the edge between nodes tlbl and flbl.
+        When virtualized, this puts it on the canvas if it wasn't already.'''
+        if tlbl == flbl:
+            return None
+        
+        e = self.lines.get(frozenset((tlbl, flbl)))
+        if e is not None and self.virtual and e.layer is None:
+            self.containers[tlbl].reveal(e)
+        return e
     
     def get_edges(self, label):
         '''Find all agglines which touch node label.'''
-        ret = []
-        for subg in self.cboxes:
-            #pick the right box
-            if label in subg.vertices:
-                for edge in subg.edges:
-                    if edge.touches(label): ret.append(edge)
-        
-        return ret
+        return list(self.incident.get(label, ()))
     
     def get_container(self, label):
         '''Find subgraph which contains vertex object labeled "label".'''
-        for subg in self.cboxes:
-            if label in subg.vertices:
-                return subg
-        
-        return None
+        return self.containers.get(label)
     
     def get_bounds(self):
         '''Return the bounds for our master box.'''
+        if self.extent is not None:
+            #known since the last pack, without walking the items
+            bounds = GooCanvas.CanvasBounds()
+            bounds.x1, bounds.y1, bounds.x2, bounds.y2 = self.extent
+            return bounds
+        
         return self.gbox.get_bounds()
     
-class Packer(object):
-    '''Tree for packing rectangles into an area.'''
-    def __init__(self, x, y, width, height):
-        '''Set up this node of the tree.'''
-        self.x = x
-        self.y = y
-        self.w = width
-        self.h = height
-        self.child = None
-        self.used = False
-    
-    def place(self, width, height):
-        '''Find coordinates for a box of width,height.'''
-        if self.child != None:
-            #if we aren't a child, try our 0 child first
-            coords = self.child[0].place(width, height)
-            if coords != None:
-                return coords
-        
-            #if that fails, try the 1 child
-            return self.child[1].place(width, height)
-        else:
-            #if we're a leaf...
-            #can't place something if we're occupied
-            if self.used: return None
-            #nor if the box is too big for us
-            if width > self.w or height > self.h: return None
-            #but if it's exactly the right size, go ahead
-            if width == self.w and height == self.h:
-                self.used = True
-                return (self.x, self.y)
-            
-            #by now, we have the space to hold said box, so let's allocate it
-            self.child = []
-            
-            dw = self.w - width
-            dh = self.h - height
-            
-            if dw > dh:
-                #set up children so child[0] has the exact width needed
-                self.child.append(Packer(self.x, self.y, width, self.h))
-                self.child.append(Packer(self.x + width, self.y, self.w - width, self.h))
-            else:
-                #set up children so child[0] has the exact height needed
-                self.child.append(Packer(self.x, self.y, self.w, height))
-                self.child.append(Packer(self.x, self.y + height, self.w, self.h - height))
-            
-            #ask our tailored child to place the box
-            return self.child[0].place(width, height)
-
+    def find_item(self, x, y):
+        '''Return the vertex or edge at x, y in canvas coordinates, or None.'''
+        for subg in self.boxes.query((x, y, x, y)):
+            item = subg.item_at(x - subg.get_property('x'), y - subg.get_property('y'))
+            if item is not None:
+                return item
+        
+        return None
+    
+    def find_vertices(self, x1, y1, x2, y2):
+        '''Return the vertices centered within the box from x1, y1 to x2, y2 in canvas coordinates.'''
+        found = []
+        for subg in self.boxes.query((x1, y1, x2, y2)):
+            ox = subg.get_property('x')
+            oy = subg.get_property('y')
+            found.extend(subg.vertices_in((x1 - ox, y1 - oy, x2 - ox, y2 - oy)))
+        
+        return found
+    
+    def _on_press(self, canvas, event):
+        '''Event handler. Hand a click to whatever's under the pointer, or start a rubber band.'''
+        x, y = self.convert_from_pixels(event.x, event.y)
+        item = self.find_item(x, y)
+        if item is None:
+            if event.button == 1:
+                self.band = (x, y)
+            return False
+        
+        if item.type == 'node':
+            if self.node_callback != None: self.node_callback(item, item, event)
+            self._drag_start(item, item, event)
+        elif self.line_callback != None:
+            self.line_callback(item, item, event)
+        return True
+    
+    def _on_motion(self, canvas, event):
+        '''Event handler. Drag a vertex or a rubber band, or keep track of what the pointer is over.'''
+        if self.drag is not None:
+            return self._drag_motion(self.drag[0], None, event)
+        
+        x, y = self.convert_from_pixels(event.x, event.y)
+        if self.band is not None:
+            self._band_motion(x, y)
+            return True
+        
+        item = self.find_item(x, y)
+        if item is not self.hover:
+            if self.hover is not None and self.mouseover_callback != None: self.mouseover_callback(self.hover, self.hover, event, False)
+            if item is not None and self.mouseover_callback != None: self.mouseover_callback(item, item, event, True)
+            self.hover = item
+        return True
+    
+    def _on_release(self, canvas, event):
+        '''Event handler. Finish dragging a vertex or a rubber band.'''
+        if self.drag is not None:
+            return self._drag_end(self.drag[0], None, event)
+        
+        if self.band is None:
+            return False
+        
+        x1, y1 = self.band
+        self.band = None
+        if self.band_rect is None:
+            return False
+        
+        self.band_rect.remove()
+        self.band_rect = None
+        x2, y2 = self.convert_from_pixels(event.x, event.y)
+        found = self.find_vertices(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        
+        #selection rings need the vertices on the canvas
+        if self.virtual:
+            for v in found:
+                self.containers[v.label].reveal(v)
+        if self.band_callback != None: self.band_callback(found)
+        return True
+    
+    def _on_leave(self, canvas, event):
+        '''Event handler. Forget what the pointer was over once it leaves the canvas.'''
+        if self.hover is not None and self.mouseover_callback != None: self.mouseover_callback(self.hover, self.hover, event, False)
+        self.hover = None
+        return False
+    
+    def _band_motion(self, x, y):
+        '''Stretch the rubber band to x, y, showing it once it's bigger than a click.'''
+        bx, by = self.band
+        scale = self.get_scale()
+        if self.band_rect is None:
+            if abs(x - bx)*scale < self.drag_threshold and abs(y - by)*scale < self.drag_threshold:
+                return
+            self.band_rect = GooCanvas.CanvasRect(parent=self.root, stroke_color_rgba=0x3465a4ff, fill_color_rgba=0x3465a433, line_width=1, line_width_is_unscaled=True)
+        
+        self.band_rect.set_properties(x=min(x, bx), y=min(y, by), width=abs(x - bx), height=abs(y - by))
+    
+    def _drag_start(self, vertex, target, event):
+        '''Event handler. Get ready to drag vertex around with the first mouse button.'''
+        if event.button != 1:
+            return False
+        
+        #a background layout would fight the user for this component
+        cbox = self.get_container(vertex.label)
+        if self.run is not None and cbox in self.run.pending:
+            self.cancel_layout()
+        
+        self.drag = (vertex, event.x_root, event.y_root, vertex.x, vertex.y)
+        self.drag_to = None
+        mask = Gdk.EventMask.POINTER_MOTION_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK
+        self.pointer_grab(vertex, mask, Gdk.Cursor(Gdk.CursorType.FLEUR), event.time)
+        return False
+    
+    def _drag_motion(self, vertex, target, event):
+        '''Event handler. Follow the pointer, moving the dragged vertex once per frame at most.'''
+        if self.drag is None or self.drag[0] is not vertex:
+            return False
+        
+        v, px, py, vx, vy = self.drag
+        dx = event.x_root - px
+        dy = event.y_root - py
+        if self.drag_to is None and abs(dx) < self.drag_threshold and abs(dy) < self.drag_threshold:
+            return True
+        
+        #pointer motion is in pixels, so undo the zoom
+        scale = self.get_scale()
+        self.drag_to = (vx + dx/scale, vy + dy/scale)
+        
+        #motion events can come much faster than frames, so only the latest one is drawn
+        if self.drag_idle is None:
+            self.drag_idle = GLib.idle_add(self._drag_update)
+        return True
+    
+    def _drag_update(self):
+        '''Idle callback. Move the dragged vertex to where the pointer last was.'''
+        self.drag_idle = None
+        if self.drag is None or self.drag_to is None:
+            return False
+        
+        v = self.drag[0]
+        x, y = self.drag_to
+        self.get_container(v.label).move_vertex(v.label, x, y)
+        return False
+    
+    def _drag_end(self, vertex, target, event):
+        '''Event handler. Drop the dragged vertex and pin it where it landed.'''
+        if self.drag is None or self.drag[0] is not vertex:
+            return False
+        
+        self.pointer_ungrab(vertex, event.time)
+        if self.drag_idle is not None:
+            GLib.source_remove(self.drag_idle)
+        moved = self.drag_to is not None
+        if moved:
+            self._drag_update()
+        self.drag = None
+        self.drag_to = None
+        if not moved:
+            return False
+        
+        cbox = self.get_container(vertex.label)
+        self.pinned.add(vertex.label)
+        self.repack([cbox])
+        self.positions[vertex.label] = (vertex.x + cbox.get_property('x'), vertex.y + cbox.get_property('y'))
+        if self.move_callback != None: self.move_callback(vertex)
+        return True
+    
 class AggLine(GooCanvas.CanvasGroup):
     '''Represent an aggregate line with properties derived from all the relationships between its start and end points.'''
     
-    def __init__(self, fnode, tnode, rels=None, painter=None, sheet=None, **args):
+    def __init__(self, fnode, tnode, rels=None, painter=None, sheet=None, detail='full', layer=None, **args):
         '''Create a new aggregate line.'''
         GooCanvas.CanvasGroup.__init__(self, **args)
 
@@ -288,6 +1270,8 @@ class AggLine(GooCanvas.CanvasGroup):
         self.weights = []
         self.origin = fnode #vertex object
         self.dest = tnode #vertex object
+        fnode.edges.add(self)
+        tnode.edges.add(self)
         self.labels_both = []
         self.labels_from = []
         self.labels_to = []
@@ -297,6 +1281,9 @@ class AggLine(GooCanvas.CanvasGroup):
         self.selected = False
         self.stylesheet = sheet
         self.selring = None
+        self.detail = detail #level of detail to paint at, see Canvas.detail
+        self.layer = layer #EdgeLayer that strokes us while we're off the canvas, if any
+        self.shapes = None #what our painter drew, for it to update in place
         
         if sheet == None:
             self.stylesheet = Stylesheet()
@@ -353,6 +1340,25 @@ class AggLine(GooCanvas.CanvasGroup):
         #reply that this event has been handled
         return True
     
+    def recycle(self, fnode, tnode, rels, sheet=None, detail='full', layer=None):
+        '''Make us the edge between fnode and tnode, as if we'd just been created.
+        We're left off the canvas; add us to one and draw.'''
+        if self.get_parent() is not None:
+            self.remove()
+        self.origin.edges.discard(self)
+        self.dest.edges.discard(self)
+        
+        self.origin = fnode
+        self.dest = tnode
+        fnode.edges.add(self)
+        tnode.edges.add(self)
+        self.detail = detail
+        self.stylesheet = sheet if sheet is not None else Stylesheet()
+        if layer is not self.layer:
+            self.shapes = None
+        self.layer = layer
+        self.set_rels(rels)
+    
     def get_heaviest(self):
         '''Find the relationship with the highest weight.'''
         return self.rels[0]
@@ -373,6 +1379,16 @@ class AggLine(GooCanvas.CanvasGroup):
         
         self.rels.append(rel)
     
+    def set_rels(self, rels):
+        '''Replace all of our relationships with those in rels.'''
+        del self.rels[:]
+        for rel in rels:
+            self._add_rel(rel)
+        
+        self.calc_width() #calculate new average weight
+        self.calc_label() #calculate new label text
+        self.rels = sorted(self.rels, key=attrgetter('weight', 'label'), reverse=True)
+    
     def remove_rel(self, rel):
         '''Remove a relationship.'''
         if self.rels.count(rel):
@@ -430,20 +1446,42 @@ class AggLine(GooCanvas.CanvasGroup):
         self.painter = painter
     
     def draw(self):
-        '''Draw with our painter.'''
+        '''Draw with our painter, unless we're off the canvas.
+        Our EdgeLayer, if we have one, is kept up to date either way.'''
         if self.painter == None:
             return
         
+        if self.layer is not None:
+            self.layer.update(self)
+        if self.get_parent() is None:
+            return
+        
+        #most of the time, what's there just needs adjusting
+        if self.painter.update(self):
+            return
+        
         #remove any child objects we have
         for x in reversed(xrange(self.get_n_children())):
             self.get_child(x).remove()
         
         shape = self.painter.paint(self)
+        
+        #our selection ring went with the other children, so bring it back
+        if self.selected:
+            self.selring = self.painter.show_selected(self)
     
     def set_selected(self, state):
         '''Mark our selected status and draw selection ring.'''
         self.selected = state
         
+        #an edge in an EdgeLayer only has items of its own while it's selected
+        if self.layer is not None:
+            if self.selected:
+                self.layer.get_parent().reveal(self)
+            else:
+                self.layer.get_parent().conceal(self)
+            return
+        
         if self.selected:
             self.selring = self.painter.show_selected(self)
         else:
@@ -465,13 +1503,138 @@ class AggLine(GooCanvas.CanvasGroup):
     
     def shift(self, oldlbl, new_obj):
         '''Change an endpoint to use a new object.'''
-        if self.origin.label == oldlbl: self.origin = new_obj
-        elif self.dest.label == oldlbl: self.dest = new_obj
+        if self.origin.label == oldlbl:
+            self.origin.edges.discard(self)
+            self.origin = new_obj
+        elif self.dest.label == oldlbl:
+            self.dest.edges.discard(self)
+            self.dest = new_obj
+        else:
+            return
+        new_obj.edges.add(self)
+
+class EdgeLayer(GooCanvas.CanvasItemSimple):
+    '''Stroke all of a SubGraph's edges as a single canvas item.
+    
+    AggLines given to us stay off the canvas and just tell us where they are
+    whenever they draw. We keep their ends in one array, only stroke the ones
+    in the exposed area, and find the edge under the pointer geometrically
+    instead of through per-item events. An edge put on the canvas anyway,
+    like a selected one, paints over its own stroke here.'''
+    
+    slop = 3 #how far from an edge still counts as over it, for hit testing
+    
+    def __init__(self, sheet=None, **args):
+        '''Create an empty layer.'''
+        GooCanvas.CanvasItemSimple.__init__(self, **args)
+        
+        self.stylesheet = sheet
+        self.detail = 'full' #level of detail to paint at, see Canvas.detail
+        self.edges = [] #AggLines, by row
+        self.rows = {} #AggLine -> its row in ends and widths
+        self.ends = zeros((64, 4)) #startx, starty, endx, endy of each row's line
+        self.widths = zeros(64) #line width of each row
+        self.index = layouts.spatial.SpatialIndex() #where the edges are, for hit testing
+        
+        if sheet == None:
+            self.stylesheet = Stylesheet()
+    
+    def update(self, edge):
+        '''Store where edge is and how wide, adding it if it's new.'''
+        row = self.rows.get(edge)
+        if row is None:
+            row = len(self.edges)
+            if row == len(self.widths):
+                self.ends = concatenate((self.ends, zeros((row, 4))))
+                self.widths = concatenate((self.widths, zeros(row)))
+            self.rows[edge] = row
+            self.edges.append(edge)
+        
+        x1, y1, x2, y2 = edge.painter.ends(edge)
+        width = edge.width/2
+        self.ends[row] = (x1, y1, x2, y2)
+        self.widths[row] = width
+        
+        m = width + self.slop
+        self.index.insert(edge, (min(x1, x2) - m, min(y1, y2) - m, max(x1, x2) + m, max(y1, y2) + m))
+        self.changed(True)
+    
+    def drop(self, edge):
+        '''Stop stroking edge, moving the last row into its place.'''
+        row = self.rows.pop(edge, None)
+        if row is None:
+            return
+        
+        last = self.edges.pop()
+        if last is not edge:
+            n = len(self.edges)
+            self.edges[row] = last
+            self.rows[last] = row
+            self.ends[row] = self.ends[n]
+            self.widths[row] = self.widths[n]
+        self.index.remove(edge)
+        self.changed(True)
+    
+    def edge_at(self, x, y):
+        '''Return the edge closest to x, y if we're over one, or None.'''
+        best = None
+        closest = None
+        for e in self.index.query((x, y, x, y)):
+            row = self.rows[e]
+            dist = _segment_distance(x, y, *self.ends[row]) - self.widths[row]/2
+            
+            if dist <= self.slop and (closest is None or dist < closest):
+                best = e
+                closest = dist
+        
+        return best
+    
+    def do_simple_create_path(self, cr):
+        '''Outline the area we cover, which is what GooCanvas works out our bounds from.'''
+        extent = self.index.get_extent()
+        if extent is None:
+            return
+        
+        x1, y1, x2, y2 = extent
+        cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+    
+    def do_simple_paint(self, cr, bounds):
+        '''Stroke the edges that cross the exposed area, one path per line width.'''
+        n = len(self.edges)
+        if n == 0:
+            return
+        
+        x1, y1, x2, y2 = cr.clip_extents()
+        ends = self.ends[:n]
+        widths = self.widths[:n]
+        visible = nonzero((minimum(ends[:,0], ends[:,2]) <= x2) & (maximum(ends[:,0], ends[:,2]) >= x1) &
+                          (minimum(ends[:,1], ends[:,3]) <= y2) & (maximum(ends[:,1], ends[:,3]) >= y1))[0]
+        
+        c = self.stylesheet.stroke_color
+        if c is None: c = 0x000000ff
+        cr.set_source_rgba(((c >> 24) & 0xff)/255.0, ((c >> 16) & 0xff)/255.0, ((c >> 8) & 0xff)/255.0, (c & 0xff)/255.0)
+        
+        #zoomed far out, everything's a hairline
+        if self.detail == 'dots':
+            groups = [(cr.device_to_user_distance(1, 0)[0], visible)]
+        else:
+            groups = [(w, visible[widths[visible] == w]) for w in unique(widths[visible])]
+        
+        for width, rows in groups:
+            cr.set_line_width(width)
+            for sx, sy, ex, ey in ends[rows].tolist():
+                cr.move_to(sx, sy)
+                cr.line_to(ex, ey)
+            cr.stroke()
+    
+    def do_simple_is_item_at(self, x, y, cr, is_pointer_event):
+        '''Tell GooCanvas whether x, y is over one of our edges.'''
+        return self.edge_at(x, y) is not None
 
 class Vertex(GooCanvas.CanvasGroup):
     '''Represent a node on the canvas.'''
     
-    def __init__(self, node, x=0, y=0, painter=None, text=None, sheet=None, **args):
+    def __init__(self, node, x=0, y=0, painter=None, text=None, sheet=None, detail='full', **args):
         '''Create a new Vertex which represents node.'''
         GooCanvas.CanvasGroup.__init__(self, **args)
         
@@ -486,6 +1649,9 @@ class Vertex(GooCanvas.CanvasGroup):
         self.selring = None
         self.text = text
         self.stylesheet = sheet
+        self.detail = detail #level of detail to paint at, see Canvas.detail
+        self.shapes = None #what our painter drew, for it to update in place
+        self.edges = set() #AggLines touching us, so moving doesn't mean searching every edge
         
         #get default stylesheet if none was provided
         if sheet == None:
@@ -523,32 +1689,72 @@ class Vertex(GooCanvas.CanvasGroup):
         self.painter = painter
     
     def draw(self):
-        '''Draw with our painter, then recalculate x, y, and radius.'''
+        '''Draw with our painter, then recalculate x, y, and radius.
+        Off the canvas, we just work out how big we'd be.'''
         if self.painter == None:
             return        
         
-        #remove any child objects we have
-        for x in reversed(xrange(self.get_n_children())):
-            self.get_child(x).remove()
+        radius = self.radius
+        if self.get_parent() is None:
+            shape = self.painter.measure(self)
+            self.width = shape['width']
+            self.height = shape['height']
+            self.set_properties(x = self.x - self.width/2, y = self.y - self.height/2)
+            self.radius = sqrt(self.width*self.width + self.height*self.height) / 2
+            return
         
-        #draw some new ones
-        shape = self.painter.paint(self)
+        #most of the time, what's there just needs adjusting
+        shape = self.painter.update(self)
+        if shape is None:
+            #remove any child objects we have
+            for x in reversed(xrange(self.get_n_children())):
+                self.get_child(x).remove()
+            
+            #draw some new ones
+            shape = self.painter.paint(self)
         self.width = shape['width']
         self.height = shape['height']
         
         #now that something's drawn, center ourselves around our original x,y
         self.set_properties(x = self.x - self.width/2, y = self.y - self.height/2)
         
-        #calculate and store our new radius
-        bounds = self.get_bounds()
-        dx = bounds.x1 - self.x
-        dy = bounds.y1 - self.y
-        self.radius = sqrt(dx*dx + dy*dy)
+        #calculate and store our new radius, from corner to center
+        self.radius = sqrt(self.width*self.width + self.height*self.height) / 2
+        
+        #our selection ring was drawn to fit our old size
+        if self.selected and self.selring is not None and self.radius != radius:
+            self.selring.remove()
+            self.selring = self.painter.show_selected(self)
+    
+    def recycle(self, node, x=0, y=0, text=None, sheet=None, detail='full'):
+        '''Make us the vertex for node, as if we'd just been created.
+        We're left off the canvas; add us to one and draw.'''
+        if self.get_parent() is not None:
+            self.remove()
+        
+        self.node = node
+        self.label = node.label
+        self.x = x
+        self.y = y
+        self.text = text if text is not None else self.label
+        self.stylesheet = sheet if sheet is not None else Stylesheet()
+        self.detail = detail
+        self.edges = set()
     
     def get_xyr(self):
         '''Return a dict of x, y, and radius.'''
         return {'x':self.x, 'y':self.y, 'radius':self.radius}
     
+    def move_to(self, x, y):
+        '''Center ourselves on x, y without repainting.'''
+        self.x = x
+        self.y = y
+        self.set_properties(x = x - self.width/2, y = y - self.height/2)
+        
+        if self.selected:
+            self.selring.remove()
+            self.selring = self.painter.show_selected(self)
+    
     def set_selected(self, state):
         '''Mark our selected status and draw selection ring.'''
         self.selected = state
@@ -559,17 +1765,26 @@ class Vertex(GooCanvas.CanvasGroup):
             self.selring.remove()
 
 class SubGraph(GooCanvas.CanvasGroup):
-    '''Represents a connected subgraph on the graph.'''
+    '''Represents a connected subgraph on the graph, or the canvas's grid of trivial components.'''
     
-    def __init__(self, locs=None, graph=None, **args):
-        '''Set up accounting structures and init canvasgroup.'''
+    edge_margin = 40 #room around an edge's ends for its labels, when virtualized
+    
+    def __init__(self, locs=None, graph=None, virtual=False, **args):
+        '''Set up accounting structures and init canvasgroup.
+        
+        Virtual SubGraphs keep their vertices and edges off the canvas until
+        show_region asks for them, and track where they are in a spatial index.'''
         GooCanvas.CanvasGroup.__init__(self, **args)
         
         self.locations = locs
         self.G = graph
         self.vertices = {}
-        self.spacers = {} #dict of spacing rings for each vertex
+        self.extent = None #(x1, y1, x2, y2) around our vertices and their radii, or None to work it out again
         self.edges = []
+        self.virtual = virtual
+        self.index = layouts.spatial.SpatialIndex() #where our vertices and edges are
+        self.shown = set() #vertices and edges on the canvas, when virtual
+        self.layer = None #EdgeLayer stroking our edges, if they're batched
     
     def refresh_node(self, newlbl, oldlbl):
         '''Relabel an existing node without recalculating.'''
@@ -580,19 +1795,351 @@ class SubGraph(GooCanvas.CanvasGroup):
         self.vertices[newlbl] = self.vertices[oldlbl]
         del self.vertices[oldlbl]
         
-        #nix the old (and now likely incorrect) spacer
-        #calling function will probably want to have us add a new one with add_spacer
-        del self.spacers[oldlbl]
+        #the new label may well be a different size
+        self.extent = None
         
         #relabel our subgraph
         nx.relabel_nodes(self.G, {oldlbl:newlbl}, False)
     
-    def add_spacer(self, vname):
-        '''Add a spacer for the vertex named "vname".'''
-        v = self.vertices[vname]
-        coords = v.get_xyr()
-        ring = GooCanvas.CanvasEllipse(parent=self, fill_color_rgba=0x00000000, stroke_color_rgba=0x00000000, radius_x=coords['radius'], radius_y=coords['radius'], center_x=coords['x'], center_y=coords['y'])
-        ring.lower(v)
+    def get_locations(self):
+        '''Return the current position of each of our vertices.'''
+        return dict((lbl, (v.x, v.y)) for lbl, v in self.vertices.iteritems())
+    
+    def move_vertices(self, locations):
+        '''Move our vertices to new locations, and our edges along with them.'''
+        for lbl, v in self.vertices.iteritems():
+            #a node relabeled since the layout started won't be in there
+            if lbl not in locations: continue
+            
+            x, y = locations[lbl]
+            v.move_to(x, y)
+            self.track(v)
+        
+        self.extent = None
+        for e in self.edges:
+            self.track(e)
+            e.draw()
+    
+    def move_vertex(self, label, x, y):
+        '''Move one vertex, redrawing just the edges that touch it.'''
+        v = self.vertices[label]
+        v.move_to(x, y)
+        self.track_vertex(v)
+        for e in v.edges:
+            e.draw()
+    
+    def track(self, item):
+        '''Update where a vertex or edge is in our spatial index.'''
+        #an EdgeLayer keeps its own
+        if item.type == 'edge' and item.layer is not None:
+            return
+        
+        if item.type == 'node':
+            w = item.width / 2
+            h = item.height / 2
+            self.index.insert(item, (item.x - w, item.y - h, item.x + w, item.y + h))
+        else:
+            m = self.edge_margin
+            x1, x2 = sorted((item.origin.x, item.dest.x))
+            y1, y2 = sorted((item.origin.y, item.dest.y))
+            self.index.insert(item, (x1 - m, y1 - m, x2 + m, y2 + m))
+    
+    def add_vertex(self, v):
+        '''Take on v as one of our vertices, growing our extent to fit it.'''
+        self.vertices[v.label] = v
+        self.track(v)
+        
+        r = v.radius
+        box = (v.x - r, v.y - r, v.x + r, v.y + r)
+        if len(self.vertices) == 1:
+            self.extent = box
+        elif self.extent is not None:
+            x1, y1, x2, y2 = self.extent
+            self.extent = (min(x1, box[0]), min(y1, box[1]), max(x2, box[2]), max(y2, box[3]))
+    
+    def add_edge(self, e):
+        '''Take on e as one of our edges.'''
+        self.edges.append(e)
+        self.track(e)
+    
+    def remove_vertex(self, v):
+        '''Let go of v, one of our vertices, taking it off the canvas. Its edges should go first.'''
+        del self.vertices[v.label]
+        self.index.remove(v)
+        self.shown.discard(v)
+        if v.get_parent() is not None:
+            v.remove()
+        self.extent = None
+    
+    def remove_edge(self, e):
+        '''Let go of e, one of our edges, taking it off the canvas and out of our EdgeLayer.'''
+        self.edges.remove(e)
+        self.index.remove(e)
+        self.shown.discard(e)
+        if e.get_parent() is not None:
+            e.remove()
+        if e.layer is not None:
+            e.layer.drop(e)
+        e.origin.edges.discard(e)
+        e.dest.edges.discard(e)
+    
+    def item_at(self, x, y):
+        '''Return the vertex or edge at x, y in our coordinates, or None. Vertices win over edges.'''
+        slop = EdgeLayer.slop
+        best = None
+        closest = None
+        for item in self.index.query((x - slop, y - slop, x + slop, y + slop)):
+            if item.type == 'node':
+                if abs(x - item.x) <= item.width/2 and abs(y - item.y) <= item.height/2:
+                    return item
+                continue
+            
+            #the line drawn is edge.width/2 across
+            dist = _segment_distance(x, y, item.origin.x, item.origin.y, item.dest.x, item.dest.y) - item.width/4
+            if dist <= slop and (closest is None or dist < closest):
+                best = item
+                closest = dist
+        
+        if best is None and self.layer is not None:
+            best = self.layer.edge_at(x, y)
+        return best
+    
+    def vertices_in(self, box):
+        '''Return our vertices centered within the (x1, y1, x2, y2) box, in our coordinates.'''
+        x1, y1, x2, y2 = box
+        return [item for item in self.index.query(box) if item.type == 'node' and x1 <= item.x <= x2 and y1 <= item.y <= y2]
+    
+    def track_vertex(self, v):
+        '''Update where v and its edges are in our spatial index, after it moved or changed size.'''
+        self.extent = None
+        self.track(v)
+        for e in v.edges:
+            self.track(e)
+    
+    def get_extent(self):
+        '''Return the (x1, y1, x2, y2) box around our vertices, leaving each its radius for spacing.'''
+        if self.extent is None:
+            x1 = y1 = x2 = y2 = None
+            for v in self.vertices.itervalues():
+                r = v.radius
+                if x1 is None:
+                    x1, y1, x2, y2 = v.x - r, v.y - r, v.x + r, v.y + r
+                    continue
+                if v.x - r < x1: x1 = v.x - r
+                if v.y - r < y1: y1 = v.y - r
+                if v.x + r > x2: x2 = v.x + r
+                if v.y + r > y2: y2 = v.y + r
+            
+            self.extent = (x1, y1, x2, y2) if x1 is not None else (0, 0, 0, 0)
+        
+        return self.extent
+    
+    def show_region(self, box):
+        '''Put the vertices and edges within box on the canvas, and take the rest off.
+        
+        box is (x1, y1, x2, y2) in our own coordinates, or None for nothing.
+        Selected items always stay.'''
+        want = self.index.query(box) if box is not None else set()
+        for item in self.shown - want:
+            if not item.selected: self._detach(item)
+        
+        #vertices first, so edges end up on top as usual
+        for item in sorted(want - self.shown, key=lambda i: i.type != 'node'):
+            self._attach(item)
+    
+    def reveal(self, item):
+        '''Make sure one of our vertices or edges is on the canvas.'''
+        if item.get_parent() is None:
+            self._attach(item)
+    
+    def conceal(self, item):
+        '''Take one of our vertices or edges back off the canvas, like an edge an EdgeLayer draws.'''
+        if item.get_parent() is not None:
+            self._detach(item)
+    
+    def _attach(self, item):
+        '''Put a vertex or edge on the canvas and paint it.'''
+        self.add_child(item, -1)
+        item.draw()
+        self.shown.add(item)
+    
+    def _detach(self, item):
+        '''Take a vertex or edge off the canvas, dropping what it painted.'''
+        for x in reversed(xrange(item.get_n_children())):
+            item.get_child(x).remove()
+        item.shapes = None
+        item.remove()
+        self.shown.discard(item)
+    
+    def same_structure(self, G):
+        '''Determine whether G still has exactly our nodes' edges.'''
+        nodes = self.G.nodes()
+        if sum(G.degree(nodes).itervalues()) // 2 != self.G.number_of_edges():
+            return False
+        
+        for u, v in self.G.edges_iter():
+            if not G.has_edge(u, v): return False
+        
+        return True
+    
+    def sync(self, G):
+        '''Pick up changes in G that don't affect our layout, like relationships moved between existing edges.
+        Returns whether anything had to be redrawn.'''
+        for lbl, v in self.vertices.iteritems():
+            v.node = G.node[lbl]['node']
+        
+        redrawn = False
+        for e in self.edges:
+            rels = G[e.origin.label][e.dest.label]['rels']
+            if set(r.uid for r in rels) == set(r.uid for r in e.rels):
+                continue
+            
+            e.set_rels(rels)
+            e.draw()
+            redrawn = True
+        
+        return redrawn
+
+class LayoutRun(object):
+    '''Refine component layouts on a background thread, showing progress on the canvas as it goes.'''
+    
+    interval = 0.1 #seconds between canvas updates for one component
+    
+    def __init__(self, canvas, jobs, budget):
+        '''Prepare to lay out jobs, a list of (SubGraph, engine name, engine args), within budget seconds.'''
+        self.canvas = canvas
+        self.budget = budget
+        self.pending = set(cbox for cbox, name, kwargs in jobs)
+        self.cancelled = threading.Event()
+        
+        #the worker gets its own copies, since relabeling changes a SubGraph's graph in place
+        self.jobs = []
+        for cbox, name, kwargs in jobs:
+            self.jobs.append((cbox, nx.Graph(cbox.G), name, kwargs))
+        
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+    
+    def start(self):
+        '''Start the worker thread.'''
+        self.thread.start()
+    
+    def cancel(self):
+        '''Stop as soon as possible, and ignore anything still on its way to the canvas.'''
+        self.cancelled.set()
+    
+    def _work(self):
+        '''Thread body. Run each layout, handing results to the main loop as they come.'''
+        deadline = time() + self.budget
+        
+        #engines that can't show progress might as well use every core
+        waiting = []
+        steady = [i for i, job in enumerate(self.jobs) if job[2] not in layouts.parallel.PROGRESSIVE]
+        pool = layouts.parallel.get_pool() if len(steady) > 1 else None
+        if pool is not None:
+            for i in steady:
+                cbox, G, name, kwargs = self.jobs[i]
+                task = layouts.parallel.make_task(name, G, kwargs)
+                waiting.append((cbox, pool.apply_async(layouts.parallel.run, (task,))))
+        else:
+            steady = []
+        
+        for i, (cbox, G, name, kwargs) in enumerate(self.jobs):
+            if i in steady: continue
+            
+            #only build the in-between layouts that will actually be shown
+            if name == 'barneshut': kwargs = dict(kwargs, interval=self.interval)
+            shown = time()
+            for locations in layouts.parallel.ITERATORS[name](G, **kwargs):
+                if self.cancelled.is_set(): return
+                if time() > deadline: break
+                if time() - shown >= self.interval:
+                    GLib.idle_add(self._show, cbox, locations, False)
+                    shown = time()
+            GLib.idle_add(self._show, cbox, locations, True)
+        
+        for cbox, result in waiting:
+            while not result.ready():
+                if self.cancelled.is_set(): return
+                result.wait(self.interval)
+            GLib.idle_add(self._show, cbox, result.get(), True)
+        
+        GLib.idle_add(self._finish)
+    
+    def _show(self, cbox, locations, final):
+        '''Idle callback. Move cbox's vertices to locations.'''
+        if self.cancelled.is_set():
+            return False
+        
+        cbox.move_vertices(locations)
+        if final:
+            self.pending.discard(cbox)
+        
+        self.canvas.repack([cbox])
+        return False
+    
+    def _finish(self):
+        '''Idle callback. Let the canvas know we're done.'''
+        if not self.cancelled.is_set():
+            self.canvas._layout_finished(self)
+        return False
+
+class BuildRun(object):
+    '''Build the canvas items for a big drawing a slice at a time from idle callbacks,
+    so the window keeps drawing and taking input while it happens.'''
+    
+    def __init__(self, canvas):
+        '''Get ready to collect work for canvas. Nothing happens until start.'''
+        self.canvas = canvas
+        self.jobs = [] #(number of items, SubGraph, generator building them) still to do, the next one last
+        self.built = [] #SubGraphs whose items are all built
+        self.after = [] #(function, args) to call once everything's built
+        self.total = 0 #items to build in all
+        self.done = 0 #items built so far
+        self.idle = None #pending idle callback doing the next slice
+    
+    def add(self, cbox, steps, count):
+        '''Queue up steps, a generator building count items for cbox.'''
+        self.jobs.append((count, cbox, steps))
+        self.total += count
+    
+    def start(self):
+        '''Start building in idle callbacks.'''
+        #biggest first, so that stopping early still leaves most of the picture
+        self.jobs.sort(key=itemgetter(0))
+        self.idle = GLib.idle_add(self._step)
+        if self.canvas.build_callback != None: self.canvas.build_callback(0.0)
+    
+    def cancel(self):
+        '''Stop building. Unfinished jobs are left in self.jobs.'''
+        if self.idle is not None:
+            GLib.source_remove(self.idle)
+            self.idle = None
+    
+    def _step(self):
+        '''Idle callback. Build items until the slice is used up.'''
+        canvas = self.canvas
+        deadline = time() + canvas.build_slice
+        canvas.freeze()
+        try:
+            while self.jobs and time() < deadline:
+                count, cbox, steps = self.jobs[-1]
+                for item in steps:
+                    self.done += 1
+                    if time() >= deadline: break
+                else:
+                    self.jobs.pop()
+                    self.built.append(cbox)
+        finally:
+            canvas.thaw()
+        
+        if self.jobs:
+            if canvas.build_callback != None: canvas.build_callback(float(self.done) / self.total)
+            return True
+        
+        self.idle = None
+        canvas._build_finished(self)
+        return False
 
 class Stylesheet(object):
     '''Defines styling properties for a vertex or edge.'''
@@ -0,0 +1,343 @@
+#!/usr/bin/env python2
+
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Headless benchmarks for the drawing pipeline. Only the edges command needs a
+# display, since it draws on a real canvas; xvfb-run will do. Run from the src
+# directory, e.g.:
+#   python2 benchmark.py scaling --sizes 1000,10000,100000
+#   python2 benchmark.py suite --output before.json
+#   xvfb-run python2 benchmark.py edges --sizes 1000,10000
+
+from __future__ import division
+from time import time, strftime
+from glob import glob
+from os.path import basename, dirname, join, splitext
+from multiprocessing import Process, Queue
+from Queue import Empty
+import xml.etree.ElementTree as et
+import argparse
+import random
+import resource
+import json
+import sys
+import numpy as np
+import networkx as nx
+
+import layouts
+
+def social_graph(n, seed=None):
+    '''Make a connected, scale-free graph of n nodes that looks roughly like a social network.'''
+    return nx.barabasi_albert_graph(n, 2, seed=seed)
+
+def roster_graph(isolates, pairs, stars, seed=None):
+    '''Make a graph like an imported roster: one social component and lots of trivial ones.'''
+    G = social_graph(500, seed=seed)
+    n = len(G)
+    G.add_nodes_from(xrange(n, n + isolates))
+    n += isolates
+    for i in xrange(pairs):
+        G.add_edge(n, n + 1)
+        n += 2
+    for i in xrange(stars):
+        G.add_star(range(n, n + 5))
+        n += 5
+    return G
+
+def load_example(path):
+    '''Read the graph out of a saved Sociogram file.'''
+    data = et.parse(path).getroot().find('data')
+    G = nx.Graph()
+    for node in data.iter('node'):
+        G.add_node(node.find('label').text)
+    for rel in data.iter('rel'):
+        G.add_edge(rel.find('origin').text, rel.find('dest').text)
+    return G
+
+def timed(func, *args, **kwargs):
+    '''Run func and return the number of seconds it took.'''
+    start = time()
+    func(*args, **kwargs)
+    return time() - start
+
+def scaling(args):
+    '''Compare how the spring and Barnes-Hut layouts scale with component size.'''
+    print "%10s %12s %12s" % ("nodes", "spring (s)", "bhut (s)")
+    for n in args.sizes:
+        G = social_graph(n, seed=n)
+        
+        #spring_layout needs an n*n matrix, so past a point it can't run at all
+        if n <= args.spring_max:
+            spring = "%12.2f" % timed(layouts.spring.layout, G, scale=250*n, iterations=args.iterations)
+        else:
+            spring = "%12s" % "skipped"
+        bhut = "%12.2f" % timed(layouts.barneshut.layout, G, scale=250*n, iterations=args.iterations, tol=0)
+        
+        print "%10d %s %s" % (n, spring, bhut)
+
+def trivial(args):
+    '''Compare drawing trivial components one by one with placing them all in one grid.'''
+    G = roster_graph(args.isolates, args.pairs, args.stars, seed=1)
+    comps = [c for c in nx.connected_components(G) if layouts.trivial.is_trivial(G, c, args.trivial_max)]
+    nodes = sum(len(c) for c in comps)
+    
+    def each():
+        for c in comps:
+            layouts.spring.layout(G.subgraph(c).copy(), scale=250*len(c))
+    
+    def grid():
+        layouts.trivial.grid(G.subgraph([n for c in comps for n in c]).copy(), comps)
+    
+    print "%d trivial components with %d nodes" % (len(comps), nodes)
+    print "%10s %12s %12s %12s" % ("", "layout (s)", "groups", "packed")
+    print "%10s %12.2f %12d %12d" % ("each", timed(each), len(comps), len(comps))
+    print "%10s %12.2f %12d %12d" % ("grid", timed(grid), 1, 1)
+
+def suite(args):
+    '''Run every engine over synthetic and example graphs, measuring speed and layout quality.'''
+    graphs = []
+    for n in args.sizes:
+        graphs.append(("social-%d" % n, social_graph(n, seed=n)))
+    if args.roster:
+        graphs.append(("roster", roster_graph(5000, 1000, 500, seed=1)))
+    for path in sorted(glob(join(args.examples, '*.xml'))):
+        graphs.append((splitext(basename(path))[0], load_example(path)))
+    
+    results = []
+    print "%-24s %-10s %9s %9s %10s %6s %8s %8s %12s" % ("graph", "engine", "nodes", "time (s)", "peak (MB)", "iters", "stress", "overlap", "crossings")
+    for name, G in graphs:
+        for engine in args.engines:
+            row = {'graph': name, 'engine': engine, 'nodes': G.order(), 'edges': G.size()}
+            biggest = max(len(c) for c in nx.connected_components(G)) if G else 0
+            if engine == 'spring' and biggest > args.spring_max:
+                row['skipped'] = True
+            else:
+                row.update(_measure(G, engine, args))
+            results.append(row)
+            
+            if row.get('skipped'):
+                print "%-24s %-10s %9d %9s" % (name[:24], engine, row['nodes'], "skipped")
+            elif row.get('failed'):
+                print "%-24s %-10s %9d %9s %s" % (name[:24], engine, row['nodes'], "failed", row['reason'])
+            else:
+                crossings = "%d%s" % (row['crossings'], "" if row['crossings_exact'] else "~")
+                print "%-24s %-10s %9d %9.2f %10.1f %6d %8.4f %8d %12s" % (name[:24], engine, row['nodes'], row['seconds'],
+                    row['peak_mb'], row['iterations'], row['stress'], row['overlaps'], crossings)
+    
+    report = {'label': args.label,
+              'date': strftime("%Y-%m-%dT%H:%M:%S"),
+              'python': sys.version.split()[0],
+              'networkx': nx.__version__,
+              'numpy': np.__version__,
+              'node_size': args.node_size,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print "wrote", args.output
+
+def _measure(G, engine, args):
+    '''Lay out G in a fresh process, so its peak memory is the layout's alone.'''
+    queue = Queue()
+    worker = Process(target=_measure_worker, args=(G, engine, args, queue))
+    worker.start()
+    
+    #the worker can die without a word (out of memory, for one), so never wait on it blindly
+    deadline = time() + args.timeout if args.timeout else None
+    row = None
+    while row is None:
+        try:
+            row = queue.get(timeout=1)
+        except Empty:
+            if not worker.is_alive():
+                #it may have finished just as we gave up waiting
+                try:
+                    row = queue.get(timeout=1)
+                except Empty:
+                    row = {'failed': True, 'reason': "worker exited with code %s" % worker.exitcode}
+            elif deadline is not None and time() > deadline:
+                worker.terminate()
+                row = {'failed': True, 'reason': "timed out after %d s" % args.timeout}
+    worker.join()
+    return row
+
+def _measure_worker(G, engine, args, queue):
+    '''Process body for _measure. Lays out G the way the canvas would, one component at a time.'''
+    kwargs = {} if engine == 'pivotmds' else {'iterations': args.iterations}
+    comps = list(nx.connected_components(G))
+    trivial = [c for c in comps if layouts.trivial.is_trivial(G, c, args.trivial_max)]
+    rest = [G.subgraph(c).copy() for c in comps if not layouts.trivial.is_trivial(G, c, args.trivial_max)]
+    
+    start_mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time()
+    blocks = []
+    for subg in rest:
+        blocks.append((subg, layouts.parallel.ENGINES[engine](subg, scale=250*subg.order(), **kwargs)))
+    if trivial:
+        subg = G.subgraph([n for c in trivial for n in c]).copy()
+        blocks.append((subg, layouts.trivial.grid(subg, trivial)))
+    seconds = time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_mem
+    
+    #count steps on the biggest component separately, since reporting each one costs time
+    iterations = 0
+    if rest:
+        subg = max(rest, key=len)
+        if engine == 'spring':
+            #networkx always runs every iteration
+            iterations = args.iterations
+        else:
+            if engine == 'barneshut': kwargs['every'] = 1
+            for locations in layouts.parallel.ITERATORS[engine](subg, scale=250*subg.order(), **kwargs):
+                iterations += 1
+    
+    #stress is averaged over nodes; the rest simply add up
+    stress = 0.0
+    overlaps = 0
+    crossings = 0
+    exact = True
+    for subg, pos in blocks:
+        stress += layouts.metrics.stress(subg, pos) * subg.order()
+        overlaps += layouts.metrics.overlaps(pos, args.node_size)
+        count, ok = layouts.metrics.crossings(subg, pos)
+        crossings += count
+        exact = exact and ok
+    
+    queue.put({'seconds': seconds,
+               'peak_mb': peak / 1024, #ru_maxrss is in kilobytes
+               'iterations': iterations,
+               'stress': stress / max(G.order(), 1),
+               'overlaps': overlaps,
+               'crossings': crossings,
+               'crossings_exact': exact})
+
+def edges(args):
+    '''Compare building and painting a component's edges as one EdgeLayer with an AggLine group apiece.'''
+    #GTK wants a display as soon as it's imported, so only bring it in here
+    from gi.repository import Gtk
+    import cairo
+    import Drawing
+    import Graph
+    
+    print "%10s %-8s %10s %10s" % ("nodes", "edges", "build (s)", "paint (s)")
+    for n in args.sizes:
+        S = social_graph(n, seed=n)
+        G = Graph.Sociograph()
+        for lbl in S.nodes_iter():
+            G.add_node(str(lbl), {"node": Graph.Node(str(lbl))})
+        for a, b in S.edges_iter():
+            G.add_rel(Graph.Relationship("knows", str(a), str(b), 5, False))
+        
+        for name, minimum in (("layer", 0), ("groups", None)):
+            canvas = Drawing.Canvas()
+            canvas.edge_layer_min = minimum
+            canvas.layout_budget = 0 #one pass is enough; we're timing the items, not the layout
+            window = Gtk.OffscreenWindow()
+            window.add(canvas)
+            window.show_all()
+            
+            done = []
+            start = time()
+            canvas.redraw(G, full=True)
+            canvas.when_built(done.append, True)
+            while not done or canvas.run is not None:
+                Gtk.main_iteration()
+            build = time() - start
+            
+            #paint the whole drawing, shrunk to fit, as an export or a zoomed out view would
+            x1, y1, x2, y2 = canvas.get_bounds()
+            scale = min(args.width / max(x2 - x1, 1), args.width / max(y2 - y1, 1))
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, args.width, args.width)
+            start = time()
+            for i in xrange(args.repeats):
+                cr = cairo.Context(surface)
+                cr.scale(scale, scale)
+                cr.translate(-x1, -y1)
+                canvas.render(cr, None, scale)
+            paint = (time() - start) / args.repeats
+            
+            print "%10d %-8s %10.2f %10.3f" % (n, name, build, paint)
+            window.destroy()
+
+def pack(args):
+    '''Pack lots of components of mixed sizes, as the canvas does after a redraw.'''
+    rand = random.Random(args.seed)
+    #mostly single nodes and small groups, with the odd big component
+    sides = [60]*6 + [120]*3 + [250, 250, 600, 2000]
+    sizes = [(rand.choice(sides) * rand.uniform(0.8, 1.2), rand.choice(sides) * rand.uniform(0.8, 1.2)) for i in xrange(args.count)]
+    
+    start = time()
+    spots = layouts.packing.pack(sizes)
+    seconds = time() - start
+    
+    width = max(x + w for (x, y), (w, h) in zip(spots, sizes))
+    height = max(y + h for (x, y), (w, h) in zip(spots, sizes))
+    used = sum(w*h for w, h in sizes) / (width * height)
+    print "%d boxes packed in %.2f s into %.0f x %.0f, %.1f%% filled" % (args.count, seconds, width, height, 100*used)
+
+def _sizes(text):
+    '''Parse a comma-separated list of sizes.'''
+    return [int(s) for s in text.split(',')]
+
+def main():
+    '''Parse arguments and run the requested benchmark.'''
+    parser = argparse.ArgumentParser(description="Benchmark Sociogram's drawing pipeline.")
+    commands = parser.add_subparsers()
+    
+    cmd = commands.add_parser('scaling', help="time layout engines on ever larger components")
+    cmd.add_argument('--sizes', type=_sizes, default=_sizes("1000,2000,5000,10000,20000,50000,100000"), help="comma-separated component sizes")
+    cmd.add_argument('--spring-max', type=int, default=5000, help="largest component to try with spring_layout")
+    cmd.add_argument('--iterations', type=int, default=50, help="iterations for each engine")
+    cmd.set_defaults(func=scaling)
+    
+    cmd = commands.add_parser('suite', help="measure time, memory and layout quality for every engine")
+    cmd.add_argument('--sizes', type=_sizes, default=_sizes("1000,5000,20000"), help="comma-separated sizes of synthetic social graphs")
+    cmd.add_argument('--engines', type=lambda text: text.split(','), default=['spring', 'barneshut', 'pivotmds'], help="comma-separated layout engines")
+    cmd.add_argument('--examples', default=join(dirname(__file__) or '.', '..', 'examples'), help="directory of saved files to lay out too")
+    cmd.add_argument('--no-roster', dest='roster', action='store_false', help="skip the roster-like graph full of trivial components")
+    cmd.add_argument('--spring-max', type=int, default=5000, help="largest component to try with spring_layout")
+    cmd.add_argument('--iterations', type=int, default=50, help="iterations for the spring and Barnes-Hut engines")
+    cmd.add_argument('--trivial-max', type=int, default=10, help="largest tree placed on the trivial component grid")
+    cmd.add_argument('--timeout', type=int, default=3600, help="seconds to let one engine run on one graph, or 0 for no limit")
+    cmd.add_argument('--node-size', type=float, default=60, help="width of the box each node is assumed to take up")
+    cmd.add_argument('--label', default="", help="name for this run, such as a version number, saved with the results")
+    cmd.add_argument('--output', default="benchmark.json", help="file to write results to, as JSON")
+    cmd.set_defaults(func=suite)
+    
+    cmd = commands.add_parser('edges', help="time drawing edges with an EdgeLayer against an AggLine apiece (needs a display)")
+    cmd.add_argument('--sizes', type=_sizes, default=_sizes("1000,5000,20000"), help="comma-separated component sizes")
+    cmd.add_argument('--width', type=int, default=2000, help="width and height in pixels of the image painted")
+    cmd.add_argument('--repeats', type=int, default=5, help="times to paint each drawing, to average over")
+    cmd.set_defaults(func=edges)
+    
+    cmd = commands.add_parser('pack', help="time packing many components of mixed sizes")
+    cmd.add_argument('--count', type=int, default=10000, help="number of components")
+    cmd.add_argument('--seed', type=int, default=1, help="random seed for the component sizes")
+    cmd.set_defaults(func=pack)
+    
+    cmd = commands.add_parser('trivial', help="time the trivial component fast path on a roster-like graph")
+    cmd.add_argument('--isolates', type=int, default=5000, help="number of isolated nodes")
+    cmd.add_argument('--pairs', type=int, default=1000, help="number of two-node components")
+    cmd.add_argument('--stars', type=int, default=500, help="number of five-node stars")
+    cmd.add_argument('--trivial-max', type=int, default=10, help="largest tree treated as trivial")
+    cmd.set_defaults(func=trivial)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
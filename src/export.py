@@ -0,0 +1,582 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Headless export of saved Sociogram files to PNG, SVG and PDF. Drawing goes
+# straight to cairo surfaces, so there's no need for a display or a main loop.
+# Run from the src directory, e.g.:
+#   python2 export.py "../examples/Romeo and Juliet.xml" -o romeo.pdf
+#   python2 export.py diagrams/*.xml --format png --outdir rendered
+#   python2 export.py huge.xml -o huge.dzi --scale 2
+# Deep Zoom (.dzi) output is a pyramid of tiles, for diagrams too big to render
+# as one image.
+
+from __future__ import division
+from math import sqrt, atan, radians, ceil, log
+from os import makedirs
+from os.path import basename, isdir, join, splitext
+from textwrap import TextWrapper
+from multiprocessing import Pool, cpu_count
+import argparse
+import xml.etree.ElementTree as et
+
+import cairo
+from gi.repository import Pango, PangoCairo
+import networkx as nx
+from numpy import mean
+
+import Graph
+import layouts
+
+FORMATS = ('png', 'svg', 'pdf', 'dzi')
+TILE_SIZE = 256 #pixels across each tile of a Deep Zoom image
+
+_shared = None #Diagram that worker processes draw tiles of
+
+class Style(object):
+    '''How to draw, matching the defaults the editor gives its canvas.'''
+    
+    def __init__(self):
+        '''Set default drawing values.'''
+        self.background = 0xffffffff
+        self.vertex_fill = 0xffff00ff
+        self.vertex_stroke = 0x000000ff
+        self.edge_stroke = 0x000000ff
+        self.text_color = 0x000000ff
+        self.font = Pango.FontDescription('sans normal 11')
+        self.line_width = 2 #of vertex boxes, as on the canvas
+        self.wrap_width = 8 #characters per line of a node label
+        self.padding = 10 #empty space around the whole drawing
+        self.large_component = 1000 #components with at least this many nodes use the Barnes-Hut layout
+        self.huge_component = 20000 #and those with at least this many use pivot MDS
+        self.trivial_max = 10 #largest tree placed on the trivial component grid
+        self.trivial_spacing = 100 #room each node gets on that grid
+        self.plain_scale = 0.5 #below this zoom, edges lose their labels and arrowheads
+        self.dots_scale = 0.25 #below this zoom, vertices are drawn as dots and edges as hairlines
+
+def load(path):
+    '''Read a saved file. Returns the graph, with any saved locations and offsets as taken by Canvas.restore.'''
+    data = et.parse(path).getroot().find('data')
+    G = Graph.Sociograph()
+    locations = {}
+    offsets = {}
+    
+    for node in data.iter('node'):
+        label = node.find('label').text
+        G.add_node(label, {'node': Graph.Node(label, uid=node.find('uid').text)})
+        
+        pos = node.find('pos')
+        if pos is not None:
+            try:
+                locations[label] = (int(pos.get('component')), float(pos.get('x')), float(pos.get('y')))
+            except (TypeError, ValueError):
+                pass
+    
+    for rel in data.iter('rel'):
+        mutual = rel.find('mutual').text == "True"
+        weight = int(float(rel.find('weight').text))
+        G.add_rel(Graph.Relationship(rel.find('label').text, rel.find('origin').text, rel.find('dest').text, weight, mutual, uid=rel.find('uid').text))
+    
+    for comp in data.iter('component'):
+        try:
+            offsets[int(comp.get('id'))] = (float(comp.get('x')), float(comp.get('y')))
+        except (TypeError, ValueError):
+            pass
+    
+    return (G, locations, offsets)
+
+class Diagram(object):
+    '''A document laid out and measured, ready to render to any number of surfaces.'''
+    
+    def __init__(self, G, locations=None, offsets=None, style=None, engine=None):
+        '''Lay out G, keeping whatever components locations and offsets fully describe.'''
+        self.G = G
+        self.style = style or Style()
+        self.engine = engine #layout engine name, or None to pick by component size
+        self.context = PangoCairo.FontMap.get_default().create_context()
+        self.wrapper = TextWrapper(width=self.style.wrap_width)
+        
+        self.labels = {} #node label -> (wrapped text, box size)
+        for n in G:
+            text = self.wrapper.fill(n)
+            lw, lh = self._extents(text)
+            self.labels[n] = (text, max(lw, lh) + 20)
+        
+        self.positions = {} #node label -> x, y
+        self._arrange(locations or {}, offsets or {})
+        
+        self.bounds = (0, 0, 0, 0) #x1, y1, x2, y2 around everything
+        if self.positions:
+            self.bounds = self._extent(self.positions)
+        
+        self.edges = {} #(label, label) -> how to draw that edge, from _edge
+        for a, b, data in G.edges_iter(data=True):
+            shape = self._edge(a, b, data['rels'])
+            if shape is not None: self.edges[(a, b)] = shape
+        
+        #edges go under vertices
+        self.order = [('edge',) + key for key in self.edges] + [('node', n) for n in G]
+        self.rank = dict((item, i) for i, item in enumerate(self.order)) #item -> its place in the drawing order
+        self.index = None #spatial index of order, for drawing just part of the picture; see _get_index
+    
+    def render(self, path, fmt=None, scale=1):
+        '''Draw to path as a PNG, SVG or PDF, going by fmt or else path's extension.'''
+        fmt = fmt or splitext(path)[1][1:].lower()
+        if fmt not in FORMATS:
+            raise ValueError("Can't export to %r; use one of %s." % (fmt, ', '.join(FORMATS)))
+        if fmt == 'dzi':
+            self.render_pyramid(path, scale)
+            return
+        
+        x1, y1, x2, y2 = self.bounds
+        pad = self.style.padding
+        width = (x2 - x1 + 2*pad) * scale
+        height = (y2 - y1 + 2*pad) * scale
+        
+        if fmt == 'png':
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(1, int(width + 0.5)), max(1, int(height + 0.5)))
+        elif fmt == 'svg':
+            surface = cairo.SVGSurface(path, width, height)
+        else:
+            surface = cairo.PDFSurface(path, width, height)
+        
+        cr = cairo.Context(surface)
+        _set_color(cr, self.style.background)
+        cr.paint()
+        cr.scale(scale, scale)
+        cr.translate(pad - x1, pad - y1)
+        self.draw(cr, scale=scale)
+        
+        if fmt == 'png':
+            surface.write_to_png(path)
+        surface.finish()
+    
+    def draw(self, cr, region=None, scale=1):
+        '''Draw onto the cairo context cr, in canvas coordinates.
+        
+        region is an (x1, y1, x2, y2) box to draw just what's in, and scale is
+        how far cr is zoomed, which decides how much detail is worth drawing.'''
+        if scale < self.style.dots_scale:
+            detail = 'dots'
+        elif scale < self.style.plain_scale:
+            detail = 'plain'
+        else:
+            detail = 'full'
+        
+        if region is None:
+            items = self.order
+        else:
+            items = sorted(self._get_index().query(region), key=self.rank.get)
+        
+        for item in items:
+            if item[0] == 'edge':
+                self._draw_edge(cr, self.edges[item[1:]], detail)
+            else:
+                self._draw_vertex(cr, item[1], detail)
+    
+    def render_tile(self, path, x, y, width, height, scale=1):
+        '''Draw the width by height pixels whose top left is x, y in a render at scale, to a PNG at path.'''
+        x1, y1, x2, y2 = self.bounds
+        pad = self.style.padding
+        
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        cr = cairo.Context(surface)
+        _set_color(cr, self.style.background)
+        cr.paint()
+        cr.translate(-x, -y)
+        cr.scale(scale, scale)
+        cr.translate(pad - x1, pad - y1)
+        
+        #what the tile covers, in canvas coordinates
+        left = x/scale - pad + x1
+        top = y/scale - pad + y1
+        self.draw(cr, (left, top, left + width/scale, top + height/scale), scale)
+        
+        surface.write_to_png(path)
+        surface.finish()
+    
+    def render_pyramid(self, path, scale=1, tile=TILE_SIZE, procs=1):
+        '''Write a Deep Zoom image: a .dzi description at path, and PNG tiles for every zoom level beside it.
+        
+        Tiles are drawn straight from the vector data and written as they're
+        done, so memory use doesn't grow with the output's size. With procs
+        above 1, they're drawn by that many worker processes.'''
+        x1, y1, x2, y2 = self.bounds
+        pad = self.style.padding
+        width = int(ceil((x2 - x1 + 2*pad) * scale))
+        height = int(ceil((y2 - y1 + 2*pad) * scale))
+        top = int(ceil(log(max(width, height, 1), 2)))
+        
+        base = splitext(path)[0] + '_files'
+        for level in xrange(top + 1):
+            folder = join(base, str(level))
+            if not isdir(folder): makedirs(folder)
+        
+        def tasks():
+            for level in xrange(top + 1):
+                shrink = 2 ** (top - level)
+                w = int(ceil(width / shrink))
+                h = int(ceil(height / shrink))
+                for col in xrange(int(ceil(w / tile))):
+                    for row in xrange(int(ceil(h / tile))):
+                        out = join(base, str(level), "%d_%d.png" % (col, row))
+                        yield (out, col*tile, row*tile, min(tile, w - col*tile), min(tile, h - row*tile), scale / shrink)
+        
+        #workers are forked with us already in _shared, index and all, so nothing big is sent or rebuilt
+        global _shared
+        _shared = self
+        self._get_index()
+        try:
+            if procs > 1:
+                pool = Pool(procs)
+                try:
+                    for done in pool.imap_unordered(_render_tile, tasks(), chunksize=16):
+                        pass
+                    pool.close()
+                except:
+                    pool.terminate()
+                    raise
+                finally:
+                    pool.join()
+            else:
+                for task in tasks():
+                    _render_tile(task)
+        finally:
+            _shared = None
+        
+        with open(path, 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" Overlap="0" TileSize="%d">\n' % tile)
+            f.write('  <Size Width="%d" Height="%d"/>\n' % (width, height))
+            f.write('</Image>\n')
+    
+    def _get_index(self):
+        '''Return a spatial index of everything we draw, making it the first time.'''
+        if self.index is None:
+            self.index = layouts.spatial.SpatialIndex()
+            for n, (x, y) in self.positions.iteritems():
+                r = self.labels[n][1] / 2 + self.style.line_width
+                self.index.insert(('node', n), (x - r, y - r, x + r, y + r))
+            for (a, b), shape in self.edges.iteritems():
+                self.index.insert(('edge', a, b), self._edge_box(shape))
+        
+        return self.index
+    
+    def _edge_box(self, shape):
+        '''Return the (x1, y1, x2, y2) box an edge worked out by _edge could draw in.'''
+        line = shape['line']
+        xs = [line[0], line[2]]
+        ys = [line[1], line[3]]
+        for arrow in shape['arrows']:
+            xs.extend(arrow[0::2])
+            ys.extend(arrow[1::2])
+        
+        #labels are measured flat; rotated, they still fit in a circle that wide around their anchor
+        m = shape['width']
+        for text, x, y, angle, side in shape['labels']:
+            lw, lh = self._extents(text)
+            r = sqrt(lw*lw/4 + lh*lh)
+            xs.extend((x - r, x + r))
+            ys.extend((y - r, y + r))
+        
+        return (min(xs) - m, min(ys) - m, max(xs) + m, max(ys) + m)
+    
+    def _arrange(self, locations, offsets):
+        '''Place every node like the canvas would, keeping saved components where they were.'''
+        style = self.style
+        packing = layouts.packing.Packing()
+        used = set()
+        jobs = []
+        trivial = []
+        for nodes in nx.connected_components(self.G):
+            if style.trivial_max is not None and layouts.trivial.is_trivial(self.G, nodes, style.trivial_max):
+                trivial.append(nodes)
+                continue
+            
+            ids = set(locations[n][0] if n in locations else None for n in nodes)
+            cid = ids.pop() if len(ids) == 1 else None
+            if cid is not None and cid not in used and cid in offsets:
+                used.add(cid)
+                self._adopt(packing, cid, nodes, locations, offsets)
+            else:
+                jobs.append(self.G.subgraph(nodes).copy())
+        
+        #the editor saves trivial components together as one grid, unless the file predates it
+        if trivial:
+            members = [n for nodes in trivial for n in nodes]
+            ids = set(locations[n][0] if n in locations else None for n in members)
+            cid = ids.pop() if len(ids) == 1 else None
+            if cid is not None and cid not in used and cid in offsets:
+                used.add(cid)
+                self._adopt(packing, cid, members, locations, offsets)
+                trivial = []
+        
+        placed = [self._layout(subg) for subg in jobs]
+        if trivial:
+            subg = self.G.subgraph([n for nodes in trivial for n in nodes]).copy()
+            placed.append(layouts.trivial.grid(subg, trivial, style.trivial_spacing))
+        
+        #biggest first leaves the fewest gaps
+        boxes = [(self._extent(locs), locs) for locs in placed]
+        boxes.sort(key=lambda box: (box[0][3] - box[0][1], box[0][2] - box[0][0]), reverse=True)
+        for (x1, y1, x2, y2), locs in boxes:
+            x, y = packing.add(id(locs), x2 - x1, y2 - y1)
+            for n, (lx, ly) in locs.iteritems():
+                self.positions[n] = (lx - x1 + x, ly - y1 + y)
+    
+    def _adopt(self, packing, cid, nodes, locations, offsets):
+        '''Put nodes back where they were saved as part of component cid, and keep their place in packing.'''
+        ox, oy = offsets[cid]
+        locs = dict((n, (locations[n][1] + ox, locations[n][2] + oy)) for n in nodes)
+        self.positions.update(locs)
+        x1, y1, x2, y2 = self._extent(locs)
+        packing.adopt(cid, x1, y1, x2 - x1, y2 - y1)
+    
+    def _layout(self, subg):
+        '''Lay out one component, picking an engine like Canvas._pick_layout does.'''
+        name = self.engine
+        if name is None:
+            if subg.order() >= self.style.huge_component:
+                name = 'pivotmds'
+            elif subg.order() >= self.style.large_component:
+                name = 'barneshut'
+            else:
+                name = 'spring'
+        return layouts.parallel.ENGINES[name](subg, scale=250*subg.order())
+    
+    def _extent(self, locations):
+        '''Return the (x1, y1, x2, y2) box around the nodes in locations, leaving each its radius.'''
+        x1 = y1 = float('inf')
+        x2 = y2 = float('-inf')
+        for n, (x, y) in locations.iteritems():
+            r = self.labels[n][1] * sqrt(2) / 2
+            x1 = min(x1, x - r)
+            y1 = min(y1, y - r)
+            x2 = max(x2, x + r)
+            y2 = max(y2, y + r)
+        return (x1, y1, x2, y2)
+    
+    def _extents(self, text):
+        '''Return the (width, height) of text in our font.'''
+        layout = self._layout_text(text)
+        ink, logical = layout.get_pixel_extents()
+        return (logical.width, logical.height)
+    
+    def _layout_text(self, text, cr=None):
+        '''Make a centered Pango layout of text, for cr if given.'''
+        layout = PangoCairo.create_layout(cr) if cr is not None else Pango.Layout(self.context)
+        layout.set_font_description(self.style.font)
+        layout.set_alignment(Pango.Alignment.CENTER)
+        layout.set_text(text, -1)
+        return layout
+    
+    def _draw_vertex(self, cr, n, detail='full'):
+        '''Draw node n as a box around its label, like painters.vertex.box.'''
+        text, size = self.labels[n]
+        x, y = self.positions[n]
+        left = x - size/2
+        top = y - size/2
+        
+        cr.rectangle(left, top, size, size)
+        if detail == 'dots':
+            #too small to read, so just a blob, as on the canvas
+            _set_color(cr, self.style.vertex_stroke)
+            cr.fill()
+            return
+        
+        _set_color(cr, self.style.vertex_fill)
+        cr.fill_preserve()
+        _set_color(cr, self.style.vertex_stroke)
+        cr.set_line_width(self.style.line_width)
+        cr.stroke()
+        
+        layout = self._layout_text(text, cr)
+        ink, logical = layout.get_pixel_extents()
+        lw = logical.width
+        lh = logical.height
+        biggest = max(lw, lh)
+        _set_color(cr, self.style.text_color)
+        cr.move_to(left + 10 + (biggest - lw)/2, top + 10 + (biggest - lh)/2)
+        PangoCairo.show_layout(cr, layout)
+    
+    def _edge(self, a, b, rels):
+        '''Work out how to draw the edge between a and b, like painters.edge.line.'''
+        width = mean([rel.weight for rel in rels]) / 2
+        start_arrow = end_arrow = False
+        labels = {'to': None, 'from': None, 'bidir': None}
+        for rel in sorted(rels, key=lambda rel: (rel.weight, rel.label)):
+            if rel.mutual:
+                start_arrow = end_arrow = True
+                labels['bidir'] = rel.label
+            else:
+                if rel.ends_at(a):
+                    start_arrow = True
+                    labels['from'] = rel.label
+                if rel.ends_at(b):
+                    end_arrow = True
+                    labels['to'] = rel.label
+        
+        #stop short of both boxes, as the canvas does
+        (ax, ay), (bx, by) = self.positions[a], self.positions[b]
+        dx = ax - bx
+        dy = ay - by
+        mag = sqrt(dx*dx + dy*dy)
+        if mag == 0:
+            return None
+        dx /= mag
+        dy /= mag
+        ra = self.labels[a][1] * sqrt(2) / 2
+        rb = self.labels[b][1] * sqrt(2) / 2
+        sx = bx + dx*(mag - ra)
+        sy = by + dy*(mag - ra)
+        ex = ax - dx*(mag - rb)
+        ey = ay - dy*(mag - rb)
+        
+        #arrowheads are sized in line widths, like GooCanvas's
+        length = 9*width
+        tip = 7*width
+        half = 7*width/2
+        line = [sx, sy, ex, ey]
+        arrows = []
+        for on, px, py, ux, uy in ((start_arrow, sx, sy, dx, dy), (end_arrow, ex, ey, -dx, -dy)):
+            if not on: continue
+            #(ux, uy) points out of the line at this end
+            arrows.append((px, py, px - ux*length - uy*half, py - uy*length + ux*half, px - ux*length + uy*half, py - uy*length - ux*half))
+        if start_arrow:
+            line[0] -= dx*tip
+            line[1] -= dy*tip
+        if end_arrow:
+            line[2] += dx*tip
+            line[3] += dy*tip
+        
+        #labels above and below the middle, reading along the line
+        parts = []
+        if labels['to']: parts.append(' '.join((a, labels['to'], b)))
+        if labels['from']: parts.append(' '.join((b, labels['from'], a)))
+        toptext = "; ".join(parts)
+        bottext = 'Both ' + labels['bidir'] if labels['bidir'] else ''
+        
+        cx = (ax + bx) / 2
+        cy = (ay + by) / 2
+        angle = atan(dy/dx) if dx else radians(90)
+        #the perpendicular that keeps the bottoms of letters facing the line
+        px = -dy if dx < 0 else dy
+        py = dx if dx < 0 else -dx
+        
+        texts = []
+        for text, side in ((toptext, 1), (bottext, -1)):
+            if text: texts.append((text, cx + side*px*3, cy + side*py*3, angle, side))
+        
+        return {'width': width, 'line': line, 'arrows': arrows, 'labels': texts}
+    
+    def _draw_edge(self, cr, shape, detail='full'):
+        '''Draw an edge worked out by _edge.'''
+        _set_color(cr, self.style.edge_stroke)
+        if detail == 'dots':
+            cr.set_line_width(cr.device_to_user_distance(1, 0)[0])
+        else:
+            cr.set_line_width(shape['width'])
+        
+        line = shape['line']
+        cr.move_to(line[0], line[1])
+        cr.line_to(line[2], line[3])
+        cr.stroke()
+        
+        #too small to read, as on the canvas
+        if detail != 'full':
+            return
+        
+        for x1, y1, x2, y2, x3, y3 in shape['arrows']:
+            cr.move_to(x1, y1)
+            cr.line_to(x2, y2)
+            cr.line_to(x3, y3)
+            cr.close_path()
+            cr.fill()
+        
+        _set_color(cr, self.style.text_color)
+        for text, x, y, angle, side in shape['labels']:
+            layout = self._layout_text(text, cr)
+            ink, logical = layout.get_pixel_extents()
+            cr.save()
+            cr.translate(x, y)
+            cr.rotate(angle)
+            #the top label sits on the line and the bottom one hangs from it
+            cr.move_to(-logical.width/2, -logical.height if side > 0 else 0)
+            PangoCairo.show_layout(cr, layout)
+            cr.restore()
+
+def _set_color(cr, rgba):
+    '''Use rgba, packed like GooCanvas's *_color_rgba properties, as cr's source.'''
+    cr.set_source_rgba(((rgba >> 24) & 0xff)/255, ((rgba >> 16) & 0xff)/255, ((rgba >> 8) & 0xff)/255, (rgba & 0xff)/255)
+
+def _render_tile(task):
+    '''Worker function. Draw one (path, x, y, width, height, scale) tile of _shared.'''
+    _shared.render_tile(*task)
+
+def export(job):
+    '''Load a file, lay it out and render it. job is (input path, output path, parsed arguments).
+    Returns the output path.'''
+    path, out, args = job
+    G, locations, offsets = load(path)
+    if args.relayout:
+        locations = offsets = None
+    
+    diagram = Diagram(G, locations, offsets, engine=args.engine)
+    if _deep_zoom(out, args):
+        diagram.render_pyramid(out, args.scale, args.tile_size, args.jobs)
+    else:
+        diagram.render(out, args.format, args.scale)
+    return out
+
+def _deep_zoom(out, args):
+    '''Determine whether out is to be written as a Deep Zoom image.'''
+    return (args.format or splitext(out)[1][1:].lower()) == 'dzi'
+
+def main():
+    '''Parse arguments and export each file given.'''
+    parser = argparse.ArgumentParser(description="Export saved Sociogram files as images, without a display.")
+    parser.add_argument('inputs', nargs='+', help="saved files to export")
+    parser.add_argument('-o', '--output', help="file to write, when exporting a single input; its extension picks the format")
+    parser.add_argument('--format', choices=FORMATS, help="format to write; defaults to the output's extension, or png")
+    parser.add_argument('--outdir', default='.', help="directory for outputs named after their inputs")
+    parser.add_argument('--scale', type=float, default=1, help="zoom to render at")
+    parser.add_argument('--engine', choices=sorted(layouts.parallel.ENGINES), help="layout engine for components without saved positions")
+    parser.add_argument('--jobs', type=int, default=cpu_count(), help="number of processes to export with")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help="pixels across each Deep Zoom tile")
+    parser.add_argument('--relayout', action='store_true', help="ignore saved positions and lay everything out again")
+    args = parser.parse_args()
+    
+    if args.output and len(args.inputs) > 1:
+        parser.error("--output only works with a single input; use --outdir instead")
+    
+    jobs = [(path, args.output or join(args.outdir, splitext(basename(path))[0] + '.' + (args.format or 'png')), args) for path in args.inputs]
+    
+    #documents are independent, so a batch can use every core, unless the cores are busy with tiles
+    procs = min(args.jobs, len(jobs))
+    if any(_deep_zoom(out, args) for path, out, args in jobs):
+        procs = 1
+    if procs > 1:
+        pool = Pool(procs)
+        outputs = pool.map(export, jobs, chunksize=1)
+        pool.close()
+    else:
+        outputs = map(export, jobs)
+    
+    for out in outputs:
+        print out
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import util
+import spring
+import barneshut
+import pivotmds
+import trivial
+import parallel
+import memo
+import packing
+import spatial
+import metrics
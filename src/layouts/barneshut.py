@@ -0,0 +1,224 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Force-directed layout for large components. Repulsion is approximated with a
+# Barnes-Hut quadtree, so each iteration costs O(n log n) instead of the O(n^2)
+# of networkx's spring_layout. Forces follow Fruchterman-Reingold, so results
+# look like those from layouts.spring.
+
+from __future__ import division
+from time import time
+import numpy as np
+
+import util
+
+MAX_DEPTH = 10 #deepest quadtree level; 4**10 cells is plenty for a few million nodes
+BATCH = 8192 #nodes walked through the tree at once, to cap memory use
+
+def layout(G, scale=1, pos=None, fixed=None, iterations=100, theta=0.8, tol=1e-4):
+    '''Lay out G with a Barnes-Hut approximation of Fruchterman-Reingold.
+    
+    theta trades accuracy for speed: a quadtree cell is treated as a single
+    body once its width is less than theta times its distance. Iteration stops
+    early once no node moves more than tol (in unit square coordinates).
+    pos and fixed work the same way as in layouts.spring.'''
+    for locations in iterlayout(G, scale, pos, fixed, iterations, theta, tol, every=0):
+        pass
+    return locations
+
+def iterlayout(G, scale=1, pos=None, fixed=None, iterations=100, theta=0.8, tol=1e-4, every=1, interval=0):
+    '''Generator version of layout.
+    
+    Yields the layout so far after every "every" iterations (never, if every is
+    0), but no more often than once per "interval" seconds, and always yields the
+    finished layout last.'''
+    nodes = G.nodes()
+    n = len(nodes)
+    if n == 0:
+        yield {}
+        return
+    if n == 1:
+        yield {nodes[0]: pos[nodes[0]] if pos and nodes[0] in pos else (0.0, 0.0)}
+        return
+    
+    index = dict((v, i) for i, v in enumerate(nodes))
+    edges = np.array([(index[u], index[v]) for u, v in G.edges_iter()], dtype=np.intp).reshape(-1, 2)
+    
+    xy = np.random.random((n, 2))
+    frame = None #pinned nodes mean results stay in the seed's frame
+    if pos is not None:
+        unit, seed_frame = util.normalize(dict((v, p) for v, p in pos.iteritems() if v in index))
+        for v, p in unit.iteritems():
+            xy[index[v]] = p
+        if fixed: frame = seed_frame
+    
+    moving = np.ones(n, dtype=bool)
+    if fixed:
+        for v in fixed:
+            if v in index: moving[index[v]] = False
+    
+    #with everything pinned, the seed is the layout
+    if not moving.any():
+        yield _locations(nodes, xy, scale, frame)
+        return
+    
+    k = np.sqrt(1.0 / n) #ideal edge length
+    t = 0.1 #temperature, the farthest a node may move in one step
+    dt = t / (iterations + 1)
+    shown = time()
+    for i in xrange(iterations):
+        disp = _repulsion(xy, k, theta) + _attraction(xy, edges, k)
+        
+        #move each node along its displacement, but no farther than the temperature allows
+        length = np.sqrt((disp * disp).sum(axis=1))
+        step = np.minimum(length, t)
+        length[length == 0] = 1
+        disp *= (step / length)[:, np.newaxis]
+        disp[~moving] = 0
+        xy += disp
+        
+        t -= dt
+        if step[moving].max() < tol:
+            break
+        if every and (i + 1) % every == 0 and i + 1 < iterations:
+            #building the dict is as dear as a step on small graphs, so skip it until someone will look
+            if interval and time() - shown < interval: continue
+            yield _locations(nodes, xy, scale, frame)
+            shown = time()
+    
+    yield _locations(nodes, xy, scale, frame)
+
+def _locations(nodes, xy, scale, frame):
+    '''Turn unit square coordinates into a dict of final positions.
+    
+    With a frame from util.normalize, positions go back into that frame;
+    otherwise they are stretched to fit [0, scale].'''
+    if frame is not None:
+        return util.denormalize(dict(zip(nodes, map(tuple, xy))), frame)
+    
+    return dict(zip(nodes, map(tuple, util.rescale(xy.copy(), scale))))
+
+def _attraction(xy, edges, k):
+    '''Sum the attractive force each node feels along its edges.'''
+    n = len(xy)
+    disp = np.zeros((n, 2))
+    if not len(edges):
+        return disp
+    
+    u = edges[:, 0]
+    v = edges[:, 1]
+    delta = xy[u] - xy[v]
+    dist = np.sqrt((delta * delta).sum(axis=1))
+    pull = delta * (dist / k)[:, np.newaxis]
+    for axis in (0, 1):
+        disp[:, axis] = np.bincount(v, weights=pull[:, axis], minlength=n) - np.bincount(u, weights=pull[:, axis], minlength=n)
+    
+    return disp
+
+def _repulsion(xy, k, theta):
+    '''Approximate the repulsive force each node feels from all the others.'''
+    n = len(xy)
+    lo = xy.min(axis=0)
+    size = (xy.max(axis=0) - lo).max()
+    if size == 0: size = 1.0
+    
+    #aim for at most a node or so per cell at the bottom of the tree
+    depth = int(np.clip(np.ceil(np.log(n) / np.log(4)) + 1, 1, MAX_DEPTH))
+    side = 1 << depth
+    cell = np.floor((xy - lo) / size * side).astype(np.intp)
+    np.clip(cell, 0, side - 1, out=cell)
+    
+    #The tree is stored as one dense grid per level. Each level keeps the node
+    #count and coordinate sums of every cell, plus which cell each node is in.
+    tree = []
+    for level in xrange(depth + 1):
+        shift = depth - level
+        owner = (cell[:, 0] >> shift) * (1 << level) + (cell[:, 1] >> shift)
+        ncells = 1 << (2 * level)
+        mass = np.bincount(owner, minlength=ncells)
+        sx = np.bincount(owner, weights=xy[:, 0], minlength=ncells)
+        sy = np.bincount(owner, weights=xy[:, 1], minlength=ncells)
+        tree.append((owner, mass, sx, sy))
+    
+    force = np.zeros((n, 2))
+    for start in xrange(0, n, BATCH):
+        _walk(xy, np.arange(start, min(start + BATCH, n)), tree, size, k, theta, force)
+    
+    return force
+
+def _walk(xy, batch, tree, size, k, theta, force):
+    '''Walk the tree for the nodes in batch, adding their repulsion into force.
+    
+    Rather than recursing per node, this keeps a frontier of (node, cell) pairs
+    and processes a whole level of the tree at once.'''
+    n = len(xy)
+    depth = len(tree) - 1
+    who = batch
+    at = np.zeros(len(batch), dtype=np.intp) #everyone starts at the root
+    
+    for level in xrange(depth + 1):
+        if not len(who):
+            break
+        
+        owner, mass, sx, sy = tree[level]
+        px = xy[who, 0]
+        py = xy[who, 1]
+        
+        #take each node out of its own cell so it doesn't push on itself
+        mine = owner[who] == at
+        m = mass[at] - mine
+        cx = sx[at] - np.where(mine, px, 0)
+        cy = sy[at] - np.where(mine, py, 0)
+        occupied = m > 0
+        safe_m = np.where(occupied, m, 1)
+        dx = px - cx / safe_m
+        dy = py - cy / safe_m
+        d2 = np.maximum(dx*dx + dy*dy, 1e-12)
+        
+        width = size / (1 << level)
+        if level == depth:
+            accept = occupied
+        else:
+            accept = occupied & ~mine & (width * width < theta * theta * d2)
+        
+        #far enough away, so the whole cell acts as one body at its center of mass
+        push = k * k * m[accept] / d2[accept]
+        force[:, 0] += np.bincount(who[accept], weights=push * dx[accept], minlength=n)
+        force[:, 1] += np.bincount(who[accept], weights=push * dy[accept], minlength=n)
+        
+        #too close, so look at the cell's children instead
+        opened = occupied & ~accept
+        who = who[opened]
+        at = at[opened]
+        if level == depth or not len(who):
+            break
+        
+        side = 1 << level
+        row = at // side
+        col = at % side
+        child_mass = tree[level + 1][1]
+        kids = []
+        for dr in (0, 1):
+            for dc in (0, 1):
+                kids.append((2*row + dr) * (2*side) + (2*col + dc))
+        at = np.concatenate(kids)
+        who = np.tile(who, 4)
+        
+        #skip empty children
+        full = child_mass[at] > 0
+        at = at[full]
+        who = who[full]
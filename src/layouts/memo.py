@@ -0,0 +1,96 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Reuses layouts between components with the same shape. Documents often hold
+# many copies of a few small structures (dyads, stars, triads), and there's no
+# need to run a layout for each one.
+
+from collections import OrderedDict, defaultdict
+
+class Shape(object):
+    '''Canonical description of a graph's structure.
+    
+    Nodes are colored by Weisfeiler-Lehman refinement, which gives a key that is
+    the same for isomorphic graphs. Ties are then broken one node at a time to
+    get a canonical node order, so positions can be carried between graphs.'''
+    
+    def __init__(self, G):
+        '''Work out the key, canonical order, and edge structure of G.'''
+        colors = _refine(G, dict((v, len(G[v])) for v in G))
+        self.key = (G.order(), G.size(), tuple(sorted(colors.itervalues())))
+        
+        #individualize one node from the first tied color class until every node is distinct
+        while len(set(colors.itervalues())) < len(colors):
+            classes = defaultdict(list)
+            for v, c in colors.iteritems():
+                classes[c].append(v)
+            tied = min(c for c, members in classes.iteritems() if len(members) > 1)
+            v = classes[tied][0]
+            colors[v] = hash((tied, 'picked'))
+            colors = _refine(G, colors)
+        
+        self.order = sorted(G, key=colors.get)
+        index = dict((v, i) for i, v in enumerate(self.order))
+        self.edges = frozenset(frozenset((index[u], index[v])) for u, v in G.edges_iter())
+
+class ShapeCache(object):
+    '''Least-recently-used store of layouts, keyed by Shape and the engine that made them.'''
+    
+    def __init__(self, limit=2000):
+        '''Create an empty cache holding at most limit layouts.'''
+        self.limit = limit
+        self.entries = OrderedDict()
+    
+    def get(self, shape, engine=None):
+        '''Return locations stored by engine for a graph with this shape, or None if there aren't any.'''
+        key = (engine, shape.key)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        
+        self.entries[key] = entry #mark as recently used
+        edges, coords = entry
+        
+        #WL keys can collide for some non-isomorphic graphs, so make sure the structure really matches
+        if edges != shape.edges:
+            return None
+        
+        return dict(zip(shape.order, coords))
+    
+    def put(self, shape, locations, engine=None):
+        '''Store locations made by engine for graphs with this shape.'''
+        key = (engine, shape.key)
+        coords = [tuple(locations[v]) for v in shape.order]
+        self.entries.pop(key, None)
+        self.entries[key] = (shape.edges, coords)
+        
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        '''Forget every stored layout.'''
+        self.entries.clear()
+
+def _refine(G, colors):
+    '''Refine node colors by their neighbors' colors until the partition stops splitting.'''
+    count = len(set(colors.itervalues()))
+    while True:
+        colors = dict((v, hash((colors[v], tuple(sorted(colors[u] for u in G[v]))))) for v in G)
+        new_count = len(set(colors.itervalues()))
+        if new_count == count:
+            return colors
+        count = new_count
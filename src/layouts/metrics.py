@@ -0,0 +1,169 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Quality measures for finished layouts, used by benchmark.py to tell whether
+# a change to the drawing pipeline made pictures better or worse. Each takes
+# a positions dict like the layout engines return.
+
+from __future__ import division
+from random import Random
+import numpy as np
+import networkx as nx
+
+CHUNK = 1 << 20 #candidate pairs tested at once
+CROSSING_LIMIT = 1 << 23 #most edge pairs tested before crossings are estimated instead
+
+def stress(G, pos, sources=20, seed=0):
+    '''Estimate the normalized stress of the layout pos of G.
+    
+    This is the mean of (e/d - 1)**2 over node pairs, where d is their graph
+    distance and e their distance in pos, after pos is scaled to fit d as well
+    as it can. 0 means distances are drawn perfectly. Only pairs with one end
+    among a sample of sources nodes are counted, so big graphs stay cheap.'''
+    nodes = sorted(G)
+    if len(nodes) > sources:
+        nodes = Random(seed).sample(nodes, sources)
+    
+    ratios = []
+    for s in nodes:
+        sx, sy = pos[s]
+        lengths = nx.single_source_shortest_path_length(G, s)
+        del lengths[s]
+        if not lengths: continue
+        
+        d = np.fromiter(lengths.itervalues(), dtype=float, count=len(lengths))
+        xy = np.array([pos[t] for t in lengths], dtype=float).reshape(-1, 2)
+        e = np.hypot(xy[:, 0] - sx, xy[:, 1] - sy)
+        ratios.append(e / d)
+    
+    if not ratios:
+        return 0.0
+    
+    r = np.concatenate(ratios)
+    #the scale that minimizes the sum of (a*r - 1)**2
+    sq = (r * r).sum()
+    a = r.sum() / sq if sq else 0.0
+    return float(((a*r - 1) ** 2).mean())
+
+def overlaps(pos, size):
+    '''Count pairs of nodes whose size by size boxes, centered on pos, overlap.'''
+    if len(pos) < 2:
+        return 0
+    
+    xy = np.array(pos.values(), dtype=float)
+    xy = xy[np.argsort(xy[:, 0], kind='mergesort')]
+    
+    #sweep along x: only boxes starting within size of each other can meet
+    ends = np.searchsorted(xy[:, 0], xy[:, 0] + size, side='left')
+    count = 0
+    for i, j in _window_pairs(ends):
+        count += int((np.abs(xy[i, 1] - xy[j, 1]) < size).sum())
+    
+    return count
+
+def crossings(G, pos, limit=CROSSING_LIMIT, seed=0):
+    '''Count pairs of edges of G that cross in the layout pos.
+    
+    A sweep along x only tests edges whose x extents overlap, which is close
+    to linear when edges are short relative to the picture. Hairballs can
+    have billions of such pairs, though, so past limit of them a random sample
+    of limit pairs is tested and the count scaled up to match. Returns the
+    count and whether it's exact. Edges that share a node don't count.'''
+    nodes = G.nodes()
+    if G.number_of_edges() < 2:
+        return (0, True)
+    
+    index = dict((v, i) for i, v in enumerate(nodes))
+    xy = np.array([pos[v] for v in nodes], dtype=float)
+    ends = np.array([(index[u], index[v]) for u, v in G.edges_iter()], dtype=np.intp)
+    
+    #point every edge left to right, then sweep in order of left ends
+    flip = xy[ends[:, 0], 0] > xy[ends[:, 1], 0]
+    ends[flip] = ends[flip][:, ::-1]
+    ends = ends[np.argsort(xy[ends[:, 0], 0], kind='mergesort')]
+    segs = _Segments(xy[ends[:, 0]], xy[ends[:, 1]], ends)
+    
+    #edge i can only meet the edges that start before it ends
+    stops = np.searchsorted(segs.a[:, 0], segs.b[:, 0], side='right')
+    counts = np.maximum(stops - np.arange(len(stops)) - 1, 0)
+    total = int(counts.sum())
+    
+    if total <= limit:
+        count = 0
+        for i, j in _window_pairs(stops):
+            count += segs.crossings(i, j)
+        return (count, True)
+    
+    #pick candidate pairs uniformly by their position in the sweep's order
+    flat = np.random.RandomState(seed).randint(0, total, limit)
+    last = np.cumsum(counts)
+    i = np.searchsorted(last, flat, side='right')
+    j = i + 1 + flat - (last[i] - counts[i])
+    
+    count = 0
+    for start in xrange(0, limit, CHUNK):
+        count += segs.crossings(i[start:start + CHUNK], j[start:start + CHUNK])
+    return (int(round(count * total / limit)), False)
+
+class _Segments(object):
+    '''Edges as line segments from a to b, along with their end nodes.'''
+    
+    def __init__(self, a, b, ends):
+        '''Store the segments and their vertical extents.'''
+        self.a = a
+        self.b = b
+        self.ends = ends
+        self.ylo = np.minimum(a[:, 1], b[:, 1])
+        self.yhi = np.maximum(a[:, 1], b[:, 1])
+    
+    def crossings(self, i, j):
+        '''Count how many of the segment pairs i[k], j[k] cross.'''
+        a, b, ends = self.a, self.b, self.ends
+        keep = (self.ylo[j] <= self.yhi[i]) & (self.ylo[i] <= self.yhi[j])
+        keep &= (ends[i, 0] != ends[j, 0]) & (ends[i, 0] != ends[j, 1])
+        keep &= (ends[i, 1] != ends[j, 0]) & (ends[i, 1] != ends[j, 1])
+        i = i[keep]
+        j = j[keep]
+        
+        #proper crossings put each segment's ends on opposite sides of the other
+        side1 = _orient(a[i], b[i], a[j]) * _orient(a[i], b[i], b[j])
+        side2 = _orient(a[j], b[j], a[i]) * _orient(a[j], b[j], b[i])
+        return int(((side1 < 0) & (side2 < 0)).sum())
+
+def _orient(p, q, r):
+    '''Twice the signed area of each triangle p, q, r; positive when counterclockwise.'''
+    return (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0])
+
+def _window_pairs(ends):
+    '''Yield chunks of index pairs (i, j) with i < j < ends[i], as two arrays.'''
+    n = len(ends)
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+    total = np.cumsum(counts)
+    
+    start = 0
+    while start < n:
+        done = total[start - 1] if start else 0
+        stop = max(int(np.searchsorted(total, done + CHUNK, side='right')), start + 1)
+        
+        c = counts[start:stop]
+        if c.sum():
+            i = np.repeat(np.arange(start, stop), c)
+            #position of each pair within its row
+            first = np.cumsum(c) - c
+            j = i + 1 + np.arange(len(i)) - np.repeat(first, c)
+            yield (i, j)
+        start = stop
@@ -0,0 +1,266 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Rectangle packing for arranging components on the canvas. This is the
+# skyline heuristic: the lower edge of everything placed so far is kept as a
+# list of horizontal segments, and each box goes wherever it can sit highest.
+# Packing keeps a packing up to date as boxes come, go and change size,
+# without moving more of them than it has to.
+
+from __future__ import division
+from collections import deque
+from math import sqrt
+
+def pack(sizes):
+    '''Pack boxes of the given (width, height) sizes into a roughly square area.
+    
+    Returns the (x, y) of each box's top left corner, in the order given.'''
+    packing = Packing(dict(enumerate(sizes)))
+    return [packing.position(i) for i in xrange(len(sizes))]
+
+def _overlap(a, b):
+    '''Determine whether the (x, y, width, height) rectangles a and b overlap.'''
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+class Packing(object):
+    '''Remember where a set of boxes was packed, so it can be changed bit by bit.
+    
+    Each box has a slot, the space it was given. Boxes that shrink keep their
+    slot, and space freed up by boxes that go away or move is kept as holes
+    for later boxes to fill.'''
+    
+    def __init__(self, sizes=None):
+        '''Pack sizes, a dict of boxes' (width, height) keyed by anything, into a roughly square area.'''
+        sizes = sizes or {}
+        widest = max([w for w, h in sizes.itervalues()] or [0])
+        area = sum(w*h for w, h in sizes.itervalues())
+        
+        self.sky = Skyline(max(widest, sqrt(area)))
+        self.slots = {} #box key -> [x, y, width, height] of its slot
+        self.holes = [] #free [x, y, width, height] rectangles above the skyline
+        
+        #tall boxes first leave a flatter skyline for the rest
+        for key in sorted(sizes, key=lambda k: (sizes[k][1], sizes[k][0]), reverse=True):
+            w, h = sizes[key]
+            x, y = self.sky.place(w, h)
+            self.slots[key] = [x, y, w, h]
+    
+    def position(self, key):
+        '''Return the top left corner of key's slot.'''
+        return tuple(self.slots[key][:2])
+    
+    def adopt(self, key, x, y, width, height):
+        '''Take note of a box that was put at x, y by someone else.'''
+        self.slots[key] = [x, y, width, height]
+        self._claim(x, y, width, height)
+    
+    def add(self, key, width, height):
+        '''Find a slot for a new box. Returns its top left corner.'''
+        #the snuggest hole that fits, if any
+        best = None
+        for i, (hx, hy, hw, hh) in enumerate(self.holes):
+            if width <= hw and height <= hh and (best is None or hw*hh < best[1]):
+                best = (i, hw*hh)
+        
+        if best is None:
+            x, y = self.sky.place(width, height)
+        else:
+            hx, hy, hw, hh = self.holes.pop(best[0])
+            x, y = hx, hy
+            
+            #split what's left along the longer leftover side
+            if hw - width > hh - height:
+                self._hole(hx + width, hy, hw - width, hh)
+                self._hole(hx, hy + height, width, hh - height)
+            else:
+                self._hole(hx, hy + height, hw, hh - height)
+                self._hole(hx + width, hy, hw - width, height)
+        
+        self.slots[key] = [x, y, width, height]
+        return (x, y)
+    
+    def remove(self, key):
+        '''Forget a box, leaving its slot free.'''
+        x, y, w, h = self.slots.pop(key)
+        self._hole(x, y, w, h)
+    
+    def replace(self, old, new):
+        '''Hand old's slot over to new, which takes its place.'''
+        self.slots[new] = self.slots.pop(old)
+    
+    def resize(self, key, width, height):
+        '''Note that a box changed size.
+        
+        A box that still fits its slot stays put. One that has outgrown it also
+        stays put and takes over the space it needs, and the neighbors that
+        were in the way are given new slots. Returns the new top left corner of
+        each box that moved.'''
+        slot = self.slots[key]
+        x, y, w, h = slot
+        if width <= w and height <= h:
+            return {}
+        
+        w = max(w, width)
+        h = max(h, height)
+        crowded = [k for k, other in self.slots.iteritems() if k != key and _overlap(other, (x, y, w, h))]
+        
+        sizes = {}
+        for k in crowded:
+            sizes[k] = tuple(self.slots[k][2:])
+            self.remove(k)
+        
+        slot[2:] = [w, h]
+        self._claim(x, y, w, h)
+        
+        moved = {}
+        for k in sorted(crowded, key=lambda k: (sizes[k][1], sizes[k][0]), reverse=True):
+            moved[k] = self.add(k, *sizes[k])
+        return moved
+    
+    def waste(self):
+        '''Return the fraction of the packed area left in holes.'''
+        area = self.sky.width * self.sky.height
+        if not area:
+            return 0.0
+        return sum(w*h for x, y, w, h in self.holes) / area
+    
+    def _hole(self, x, y, width, height):
+        '''Keep a free rectangle for later, unless it's empty.'''
+        if width > 0 and height > 0:
+            self.holes.append([x, y, width, height])
+    
+    def _claim(self, x, y, width, height):
+        '''Mark a rectangle as taken: drop the holes it touches and lower the skyline under it.'''
+        self.holes = [hole for hole in self.holes if not _overlap(hole, (x, y, width, height))]
+        self.sky.cover(x, width, y + height)
+
+class Skyline(object):
+    '''A strip of fixed width, filled from the top down.'''
+    
+    def __init__(self, width):
+        '''Start with an empty strip.'''
+        self.width = width
+        self.height = 0 #lowest point reached so far
+        
+        #the skyline, as segments sorted by x: each starts at xs[i], spans ws[i], and is filled down to ys[i]
+        self.xs = [0]
+        self.ys = [0]
+        self.ws = [width]
+    
+    def place(self, width, height):
+        '''Find a spot for a box of width by height and mark it as taken. Returns its top left corner.
+        
+        Boxes wider than the strip widen it.'''
+        if width > self.width:
+            self.ws[-1] += width - self.width
+            self.width = width
+        
+        i, y = self._find(width, height)
+        x = self.xs[i]
+        self._fill(i, x, width, y + height)
+        self.height = max(self.height, y + height)
+        return (x, y)
+    
+    def cover(self, x, width, bottom):
+        '''Make sure the skyline reaches at least down to bottom over [x, x + width).'''
+        if x + width > self.width:
+            self.ws[-1] += x + width - self.width
+            self.width = x + width
+        
+        xs, ys, ws = self.xs, self.ys, self.ws
+        right = x + width
+        self._split(x)
+        self._split(right)
+        for i in xrange(len(xs)):
+            if x <= xs[i] < right:
+                ys[i] = max(ys[i], bottom)
+        
+        #merge equally deep neighbors
+        i = 1
+        while i < len(xs):
+            if ys[i] == ys[i - 1]:
+                ws[i - 1] += ws[i]
+                del xs[i], ys[i], ws[i]
+            else:
+                i += 1
+        
+        self.height = max(self.height, bottom)
+    
+    def _split(self, x):
+        '''Make sure a segment starts at x, unless x is outside the skyline.'''
+        xs, ys, ws = self.xs, self.ys, self.ws
+        for i in xrange(len(xs)):
+            if xs[i] < x < xs[i] + ws[i]:
+                xs.insert(i + 1, x)
+                ys.insert(i + 1, ys[i])
+                ws.insert(i + 1, xs[i] + ws[i] - x)
+                ws[i] = x - xs[i]
+                return
+    
+    def _find(self, width, height):
+        '''Find the segment to start a box at, and how far down the box must go.'''
+        xs, ys, ws = self.xs, self.ys, self.ws
+        n = len(xs)
+        
+        best = None
+        j = 0 #segments i through j-1 are under the box
+        window = deque() #indexes in [i, j) with decreasing ys, so window[0] is the highest one
+        for i in xrange(n):
+            right = xs[i] + width
+            if right > self.width + 1e-9:
+                break
+            
+            #slide the window along to cover exactly the box's span
+            while window and window[0] < i:
+                window.popleft()
+            while j < n and xs[j] < right:
+                while window and ys[window[-1]] <= ys[j]:
+                    window.pop()
+                window.append(j)
+                j += 1
+            
+            y = ys[window[0]]
+            if best is None or y < best[1]:
+                best = (i, y)
+        
+        return best
+    
+    def _fill(self, i, x, width, bottom):
+        '''Raise the skyline to bottom over [x, x + width), starting at segment i.'''
+        xs, ys, ws = self.xs, self.ys, self.ws
+        right = x + width
+        
+        #drop the segments the box covers completely, and trim the one it covers partly
+        j = i
+        while j < len(xs) and xs[j] + ws[j] <= right:
+            j += 1
+        if j < len(xs) and xs[j] < right:
+            ws[j] -= right - xs[j]
+            xs[j] = right
+        del xs[i:j], ys[i:j], ws[i:j]
+        
+        xs.insert(i, x)
+        ys.insert(i, bottom)
+        ws.insert(i, width)
+        
+        #merge with equally deep neighbors so the skyline stays short
+        if i + 1 < len(xs) and ys[i + 1] == bottom:
+            ws[i] += ws[i + 1]
+            del xs[i + 1], ys[i + 1], ws[i + 1]
+        if i > 0 and ys[i - 1] == bottom:
+            ws[i - 1] += ws[i]
+            del xs[i], ys[i], ws[i]
@@ -0,0 +1,73 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Runs component layouts in worker processes. Components are independent, so
+# each one can be laid out on its own core.
+
+from multiprocessing import Pool, cpu_count
+import networkx as nx
+import numpy as np
+
+import spring
+import barneshut
+import pivotmds
+
+#layout functions by name, since tasks have to be pickled
+ENGINES = {'spring': spring.layout, 'barneshut': barneshut.layout, 'pivotmds': pivotmds.layout}
+#generator versions of the same, for layouts shown as they progress
+ITERATORS = {'spring': spring.iterlayout, 'barneshut': barneshut.iterlayout, 'pivotmds': pivotmds.iterlayout}
+#engines whose generators actually yield intermediate layouts
+PROGRESSIVE = set(['barneshut', 'pivotmds'])
+
+_pool = None
+
+def get_pool():
+    '''Return the shared worker pool, starting it if needed.
+    
+    Returns None if this machine only has one core or the pool can't start.'''
+    global _pool
+    if _pool is None:
+        try:
+            procs = cpu_count()
+        except NotImplementedError:
+            procs = 1
+        if procs < 2:
+            return None
+        
+        try:
+            _pool = Pool(procs, initializer=_reseed)
+        except OSError:
+            return None
+    
+    return _pool
+
+def make_task(name, G, kwargs):
+    '''Package a layout of G with engine name into something a worker can run.'''
+    return (name, G.nodes(), G.edges(), kwargs)
+
+def run(task):
+    '''Worker function. Rebuild the graph from a task and lay it out.'''
+    name, nodes, edges, kwargs = task
+    G = nx.Graph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    
+    return ENGINES[name](G, **kwargs)
+
+def _reseed():
+    '''Give each worker its own random state instead of a forked copy of ours.'''
+    np.random.seed()
@@ -0,0 +1,218 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# Layout for very large components by pivot multidimensional scaling (Brandes
+# and Pich). Breadth-first distances from a few hundred pivots give a global
+# picture in one shot, in time near-linear in the number of edges. A few
+# passes of sparse stress majorization, over edges and a subset of the
+# pivots, then tidy up local detail.
+
+from __future__ import division
+import numpy as np
+
+import util
+
+STRESS_PIVOTS = 20 #pivots used as anchors during stress refinement
+CHUNK = 1 << 20 #node pairs handled at once during stress refinement
+
+def layout(G, scale=1, pos=None, fixed=None, pivots=100, passes=3):
+    '''Lay out G by pivot MDS followed by sparse stress majorization.
+    
+    pivots is the number of breadth-first searches used to approximate graph
+    distances, and passes is the number of stress refinement passes. If pos is
+    given, MDS is skipped and refinement starts from those positions instead.
+    pos and fixed otherwise work the same way as in layouts.spring.'''
+    for locations in iterlayout(G, scale, pos, fixed, pivots, passes, progress=False):
+        pass
+    return locations
+
+def iterlayout(G, scale=1, pos=None, fixed=None, pivots=100, passes=3, progress=True):
+    '''Generator version of layout.
+    
+    If progress is set, yields the MDS layout and the result of each stress
+    pass. Either way, the finished layout is yielded last.'''
+    nodes = G.nodes()
+    n = len(nodes)
+    if n < 3:
+        #nothing to scale; just put them side by side
+        yield dict((v, (i*scale, 0.0)) for i, v in enumerate(nodes))
+        return
+    
+    index = dict((v, i) for i, v in enumerate(nodes))
+    edges = np.array([(index[u], index[v]) for u, v in G.edges_iter()], dtype=np.intp).reshape(-1, 2)
+    indptr, indices = _csr(edges, n)
+    
+    chosen, dist = _pivot_distances(indptr, indices, n, min(pivots, n))
+    
+    frame = None #pinned nodes mean results stay in the seed's frame
+    if pos is None:
+        xy = _mds(dist)
+        _unit_edges(xy, edges)
+        if progress and passes:
+            yield _locations(nodes, xy, scale, frame)
+    else:
+        unit, seed_frame = util.normalize(dict((v, p) for v, p in pos.iteritems() if v in index))
+        xy = np.random.random((n, 2))
+        for v, p in unit.iteritems():
+            xy[index[v]] = p
+        if fixed: frame = seed_frame
+        
+        #stress works in units of graph distance, so stretch edges to about 1 long
+        stretch = _unit_edges(xy, edges)
+        if frame is not None:
+            x0, y0, span = frame
+            frame = (x0, y0, span / stretch)
+    
+    moving = np.ones(n, dtype=bool)
+    if fixed:
+        for v in fixed:
+            if v in index: moving[index[v]] = False
+    
+    pairs = _stress_pairs(edges, chosen[:STRESS_PIVOTS], dist[:STRESS_PIVOTS], n)
+    for p in xrange(passes):
+        xy = _stress_pass(xy, pairs, moving)
+        if progress and p + 1 < passes:
+            yield _locations(nodes, xy, scale, frame)
+    
+    yield _locations(nodes, xy, scale, frame)
+
+def _locations(nodes, xy, scale, frame):
+    '''Turn layout coordinates into a dict of final positions.'''
+    if frame is not None:
+        return util.denormalize(dict(zip(nodes, map(tuple, xy))), frame)
+    
+    return dict(zip(nodes, map(tuple, util.rescale(xy.copy(), scale))))
+
+def _csr(edges, n):
+    '''Build compressed sparse row adjacency arrays from an undirected edge list.'''
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dst = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(src, kind='mergesort')
+    
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=n))
+    return (indptr, dst[order])
+
+def _bfs(indptr, indices, source, n):
+    '''Return the hop count from source to every node, or -1 where unreachable.'''
+    dist = np.empty(n, dtype=np.int32)
+    dist.fill(-1)
+    dist[source] = 0
+    
+    frontier = np.array([source], dtype=np.intp)
+    level = 0
+    while len(frontier):
+        level += 1
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        total = counts.sum()
+        if not total:
+            break
+        
+        #gather every neighbor of the frontier in one go
+        ends = np.cumsum(counts)
+        offsets = np.repeat(starts - ends + counts, counts) + np.arange(total)
+        near = indices[offsets]
+        near = near[dist[near] < 0]
+        dist[near] = level
+        frontier = np.flatnonzero(dist == level)
+    
+    return dist
+
+def _pivot_distances(indptr, indices, n, k):
+    '''Pick k pivots, each as far as possible from those already picked, and find their distances.
+    
+    Returns the pivot indices and a k*n array of distances.'''
+    chosen = np.zeros(k, dtype=np.intp)
+    dist = np.zeros((k, n))
+    closest = np.empty(n)
+    closest.fill(np.inf)
+    
+    source = np.random.randint(n)
+    for i in xrange(k):
+        d = _bfs(indptr, indices, source, n).astype(float)
+        d[d < 0] = d.max() + 1 #shouldn't happen within a component, but don't choke if it does
+        
+        chosen[i] = source
+        dist[i] = d
+        np.minimum(closest, d, out=closest)
+        source = int(closest.argmax())
+    
+    return (chosen, dist)
+
+def _mds(dist):
+    '''Classical MDS from pivot distances, projected onto the top two eigenvectors.'''
+    sq = dist.T ** 2
+    c = -0.5 * (sq - sq.mean(axis=0) - sq.mean(axis=1)[:, np.newaxis] + sq.mean())
+    
+    vals, vecs = np.linalg.eigh(c.T.dot(c))
+    top = vecs[:, -2:][:, ::-1]
+    weight = np.maximum(vals[-2:][::-1], 1e-12) ** 0.25
+    
+    return c.dot(top) / weight
+
+def _unit_edges(xy, edges):
+    '''Scale xy in place so that edges average one unit long. Returns the factor used.'''
+    if not len(edges):
+        return 1.0
+    
+    delta = xy[edges[:, 0]] - xy[edges[:, 1]]
+    length = np.sqrt((delta * delta).sum(axis=1)).mean()
+    factor = 1.0 / length if length > 0 else 1.0
+    xy *= factor
+    return factor
+
+def _stress_pairs(edges, chosen, dist, n):
+    '''List the (i, j, distance) terms for sparse stress: every edge both ways, plus each node to each pivot.'''
+    everyone = np.arange(n)
+    i = [edges[:, 0], edges[:, 1]]
+    j = [edges[:, 1], edges[:, 0]]
+    d = [np.ones(len(edges)), np.ones(len(edges))]
+    for p, row in zip(chosen, dist):
+        far = everyone != p
+        i.append(everyone[far])
+        j.append(np.repeat(p, far.sum()))
+        d.append(row[far])
+    
+    return (np.concatenate(i), np.concatenate(j), np.concatenate(d))
+
+def _stress_pass(xy, pairs, moving):
+    '''Run one pass of localized stress majorization, returning the new positions.'''
+    n = len(xy)
+    num = np.zeros((n, 2))
+    den = np.zeros(n)
+    
+    i, j, d = pairs
+    for start in xrange(0, len(i), CHUNK):
+        ii = i[start:start + CHUNK]
+        jj = j[start:start + CHUNK]
+        dd = d[start:start + CHUNK]
+        w = 1.0 / (dd * dd)
+        
+        #each term pulls i toward the spot d away from j, in the direction it already lies
+        delta = xy[ii] - xy[jj]
+        norm = np.maximum(np.sqrt((delta * delta).sum(axis=1)), 1e-9)
+        target = xy[jj] + delta * (dd / norm)[:, np.newaxis]
+        
+        den += np.bincount(ii, weights=w, minlength=n)
+        for axis in (0, 1):
+            num[:, axis] += np.bincount(ii, weights=w * target[:, axis], minlength=n)
+    
+    out = xy.copy()
+    update = moving & (den > 0)
+    out[update] = num[update] / den[update][:, np.newaxis]
+    return out
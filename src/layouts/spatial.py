@@ -0,0 +1,116 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+# A uniform grid over rectangles, for finding what lies in part of a big
+# drawing without looking at all of it.
+
+from __future__ import division
+from math import floor
+
+class SpatialIndex(object):
+    '''Find the items whose bounding boxes overlap a region.
+    
+    Items are kept in every grid cell their box touches. Boxes spanning more
+    than big cells, like edges across a whole component, are kept in a list
+    of their own instead, which is checked on every query.'''
+    
+    def __init__(self, cell=500, big=64):
+        '''Make an empty index with square cells cell units across.'''
+        self.cell = cell
+        self.big = big
+        self.boxes = {} #item -> (x1, y1, x2, y2)
+        self.cells = {} #(column, row) -> set of items
+        self.large = set() #items too big to put in cells
+        self.extent = None #(x1, y1, x2, y2) around everything, or None if it needs recalculating
+    
+    def __len__(self):
+        return len(self.boxes)
+    
+    def __contains__(self, item):
+        return item in self.boxes
+    
+    def insert(self, item, box):
+        '''Add item, whose bounding box is (x1, y1, x2, y2).'''
+        if item in self.boxes:
+            self.remove(item)
+        
+        self.boxes[item] = box
+        c1, r1, c2, r2 = self._span(box)
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > self.big:
+            self.large.add(item)
+        else:
+            for c in xrange(c1, c2 + 1):
+                for r in xrange(r1, r2 + 1):
+                    self.cells.setdefault((c, r), set()).add(item)
+        
+        if self.extent is not None:
+            x1, y1, x2, y2 = self.extent
+            self.extent = (min(x1, box[0]), min(y1, box[1]), max(x2, box[2]), max(y2, box[3]))
+        elif len(self.boxes) == 1:
+            self.extent = box
+    
+    def remove(self, item):
+        '''Take item out of the index, if it's there.'''
+        box = self.boxes.pop(item, None)
+        if box is None:
+            return
+        
+        if item in self.large:
+            self.large.remove(item)
+        else:
+            c1, r1, c2, r2 = self._span(box)
+            for c in xrange(c1, c2 + 1):
+                for r in xrange(r1, r2 + 1):
+                    bucket = self.cells[(c, r)]
+                    bucket.discard(item)
+                    if not bucket: del self.cells[(c, r)]
+        
+        #shrinking the extent would mean looking at everything, so put that off until it's asked for
+        self.extent = None
+    
+    def query(self, box):
+        '''Return the set of items whose boxes overlap box.'''
+        x1, y1, x2, y2 = box
+        found = set()
+        c1, r1, c2, r2 = self._span(box)
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > len(self.cells):
+            #the region covers more cells than there are, so look at the ones there are
+            buckets = [b for (c, r), b in self.cells.iteritems() if c1 <= c <= c2 and r1 <= r <= r2]
+        else:
+            buckets = [self.cells[(c, r)] for c in xrange(c1, c2 + 1) for r in xrange(r1, r2 + 1) if (c, r) in self.cells]
+        
+        for bucket in buckets:
+            found.update(bucket)
+        found.update(self.large)
+        
+        #cells are coarse, so check the boxes themselves
+        boxes = self.boxes
+        return set(i for i in found if boxes[i][0] <= x2 and x1 <= boxes[i][2] and boxes[i][1] <= y2 and y1 <= boxes[i][3])
+    
+    def get_extent(self):
+        '''Return the (x1, y1, x2, y2) box around everything, or None if we're empty.'''
+        if self.extent is None and self.boxes:
+            boxes = self.boxes.values()
+            self.extent = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                           max(b[2] for b in boxes), max(b[3] for b in boxes))
+        return self.extent
+    
+    def _span(self, box):
+        '''Return the first and last columns and rows that box touches.'''
+        cell = self.cell
+        return (int(floor(box[0] / cell)), int(floor(box[1] / cell)),
+                int(floor(box[2] / cell)), int(floor(box[3] / cell)))
@@ -0,0 +1,44 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+import networkx as nx
+
+import util
+
+def layout(G, scale=1, pos=None, fixed=None, iterations=50):
+    '''Lay out G with networkx's Fruchterman-Reingold implementation.
+    
+    If pos is given, it seeds the layout so that an edited component keeps
+    its old shape. Nodes listed in fixed are not moved, and in that case the
+    result stays in the same coordinate frame as pos.'''
+    if pos is None or len(G) < 2:
+        return nx.spring_layout(G, scale=scale, iterations=iterations)
+    
+    #fruchterman-reingold sizes its steps for a unit square, so fit our seed into one
+    seed = dict((n, p) for n, p in pos.iteritems() if n in G)
+    unit, frame = util.normalize(seed)
+    
+    if fixed:
+        #networkx skips its rescaling when nodes are fixed, so map back into the seed's frame
+        out = nx.spring_layout(G, pos=unit, fixed=fixed, iterations=iterations)
+        return util.denormalize(out, frame)
+    
+    return nx.spring_layout(G, pos=unit, iterations=iterations, scale=scale)
+
+def iterlayout(G, scale=1, pos=None, fixed=None, iterations=50):
+    '''Generator version of layout. networkx can't report its progress, so this only yields the finished layout.'''
+    yield layout(G, scale, pos, fixed, iterations)
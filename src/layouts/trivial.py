@@ -0,0 +1,177 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+from __future__ import division
+from math import pi, sin, cos, sqrt
+import networkx as nx
+
+def is_trivial(G, nodes, limit):
+    '''Determine whether the component of G made of nodes is a tree of at most limit nodes.'''
+    if len(nodes) > limit:
+        return False
+    
+    #a connected graph is a tree exactly when it has one edge fewer than it has nodes
+    return sum(G.degree(nodes).itervalues()) == 2*(len(nodes) - 1)
+
+def tree(G, nodes, spacing=100):
+    '''Lay out the tree made of nodes radially around its center.
+    
+    Each subtree gets a wedge in proportion to its number of leaves, and each
+    level sits on a ring at least spacing further out than the one before,
+    widened until neighbors on it are at least spacing apart.'''
+    nodes = sorted(nodes)
+    if len(nodes) == 1:
+        return {nodes[0]: (0.0, 0.0)}
+    
+    #root at the center, which has the smallest eccentricity
+    ecc = [(max(nx.single_source_shortest_path_length(G, n).itervalues()), n) for n in nodes]
+    root = min(ecc)[1]
+    
+    #breadth-first order, with children in label order so the picture is repeatable
+    order = [root]
+    children = {root: []}
+    depth = {root: 0}
+    for n in order:
+        for m in sorted(G[n]):
+            if m in depth: continue
+            depth[m] = depth[n] + 1
+            children[m] = []
+            children[n].append(m)
+            order.append(m)
+    
+    leaves = {}
+    for n in reversed(order):
+        leaves[n] = sum(leaves[m] for m in children[n]) or 1
+    
+    #hand out wedges, starting with the whole circle around the root
+    wedge = {root: (-pi, 2*pi)}
+    for n in order:
+        start, size = wedge[n]
+        for m in children[n]:
+            share = size * leaves[m] / leaves[n]
+            wedge[m] = (start, share)
+            start += share
+    
+    rings = [0.0]
+    for d in xrange(1, max(depth.itervalues()) + 1):
+        narrowest = min(wedge[n][1] for n in order if depth[n] == d)
+        rings.append(max(rings[-1] + spacing, d*spacing, spacing / narrowest))
+    
+    pos = {}
+    for n in order:
+        start, size = wedge[n]
+        r = rings[depth[n]]
+        a = start + size/2
+        pos[n] = (r*cos(a), r*sin(a))
+    
+    return pos
+
+def grid(G, components, spacing=100):
+    '''Lay out each trivial component in components and arrange them all in rows.
+    
+    components is a list of node lists. The biggest components come first and
+    equal ones are ordered by label, so rows hold components of about the same
+    size and the arrangement only shifts a little when a component comes or goes.'''
+    cells = []
+    for nodes in components:
+        pos = tree(G, nodes, spacing)
+        x0 = min(p[0] for p in pos.itervalues())
+        y0 = min(p[1] for p in pos.itervalues())
+        w = max(p[0] for p in pos.itervalues()) - x0 + spacing
+        h = max(p[1] for p in pos.itervalues()) - y0 + spacing
+        cells.append((-len(nodes), min(nodes), pos, x0, y0, w, h))
+    cells.sort()
+    
+    #aim for a roughly square block
+    width = sqrt(sum(c[5]*c[6] for c in cells))
+    
+    locations = {}
+    x = y = row = 0
+    for size, key, pos, x0, y0, w, h in cells:
+        if x > 0 and x + w > width:
+            x = 0
+            y += row
+            row = 0
+        
+        for n, (px, py) in pos.iteritems():
+            locations[n] = (px - x0 + x, py - y0 + y)
+        x += w
+        row = max(row, h)
+    
+    return locations
+
+def cell(locations, nodes, spacing=100):
+    '''Return the (x, y, width, height) grid cell of the component made of nodes, placed at locations by grid or extend.'''
+    xs = [locations[n][0] for n in nodes]
+    ys = [locations[n][1] for n in nodes]
+    return (min(xs), min(ys), max(xs) - min(xs) + spacing, max(ys) - min(ys) + spacing)
+
+def extend(G, components, cells, free, spacing=100):
+    '''Lay out components to join a grid made by grid, without moving anything already on it.
+    
+    cells lists the (x, y, width, height) cells in use, and free the cells left
+    behind by components that have gone. Each new component takes the first
+    free cell it fits in, or else carries on from the end of the last row,
+    which wraps once it's as wide as the grid. What's left of a free cell it
+    takes stays free, and free is updated in place. Returns the locations of
+    the new components' nodes.'''
+    new = []
+    for nodes in components:
+        pos = tree(G, nodes, spacing)
+        x0 = min(p[0] for p in pos.itervalues())
+        y0 = min(p[1] for p in pos.itervalues())
+        w = max(p[0] for p in pos.itervalues()) - x0 + spacing
+        h = max(p[1] for p in pos.itervalues()) - y0 + spacing
+        new.append((-len(nodes), min(nodes), pos, x0, y0, w, h))
+    new.sort()
+    
+    area = sum(c[2]*c[3] for c in cells) + sum(c[5]*c[6] for c in new)
+    width = max([sqrt(area)] + [c[0] + c[2] for c in cells])
+    
+    #grid starts every cell in a row at the same height, and each row below the last
+    x = y = row = 0
+    if cells:
+        y = max(c[1] for c in cells)
+        last = [c for c in cells if c[1] == y]
+        x = max(c[0] + c[2] for c in last)
+        row = max(c[3] for c in last)
+    
+    locations = {}
+    for size, key, pos, x0, y0, w, h in new:
+        spot = None
+        for i, (fx, fy, fw, fh) in enumerate(free):
+            if w <= fw and h <= fh:
+                spot = (fx, fy)
+                if fw > w:
+                    free[i] = (fx + w, fy, fw - w, fh)
+                else:
+                    del free[i]
+                break
+        
+        if spot is None:
+            if x > 0 and x + w > width:
+                x = 0
+                y += row
+                row = 0
+            spot = (x, y)
+            x += w
+            row = max(row, h)
+        
+        for n, (px, py) in pos.iteritems():
+            locations[n] = (px - x0 + spot[0], py - y0 + spot[1])
+    
+    return locations
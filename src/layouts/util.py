@@ -0,0 +1,53 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+
+from random import uniform
+
+def scatter(G, scale=1):
+    '''Place G's nodes at random within [0, scale].'''
+    return dict((n, (uniform(0, scale), uniform(0, scale))) for n in G)
+
+def normalize(pos):
+    '''Fit the positions in pos into the unit square.
+    
+    Returns the fitted positions along with the (x0, y0, span) frame used, so
+    that results can be mapped back with denormalize.'''
+    xs = [p[0] for p in pos.itervalues()]
+    ys = [p[1] for p in pos.itervalues()]
+    x0 = min(xs)
+    y0 = min(ys)
+    span = max(max(xs) - x0, max(ys) - y0)
+    span = float(span) if span else 1.0
+    
+    unit = {}
+    for n, (x, y) in pos.iteritems():
+        unit[n] = ((x - x0) / span, (y - y0) / span)
+    
+    return (unit, (x0, y0, span))
+
+def denormalize(pos, frame):
+    '''Map unit square positions back into the frame returned by normalize.'''
+    x0, y0, span = frame
+    return dict((n, (x*span + x0, y*span + y0)) for n, (x, y) in pos.iteritems())
+
+def rescale(xy, scale):
+    '''Shift an n*2 array of coordinates to the origin and stretch it to fit [0, scale], in place.'''
+    xy -= xy.min(axis=0)
+    lim = xy.max()
+    if lim > 0:
+        xy *= scale / float(lim)
+    return xy
@@ -1,2 +1,3 @@
+import text
 import edge
 import vertex
@@ -42,26 +42,13 @@ def _adj_coords(edge):
     
     return (startx, starty, endx, endy, dx, dy)
 
-def paint(edge):
-    '''Draw lobj, an AggLine, as a simple line with text labels along its length.'''
-    startx, starty, endx, endy, dx, dy = _adj_coords(edge)
-    
-    #construct the points
-    pts = util.mkpoints([(startx, starty), (endx, endy)])
-    
-    #get style data from edge stylesheet
-    sheet = edge.stylesheet
-    stroke = sheet.stroke_color
-    text_color = sheet.text_color
-    font = sheet.text_fontdesc
-    
-    #draw the line
-    GooCanvas.CanvasPolyline(end_arrow=edge.end_arrow, start_arrow=edge.start_arrow, points=pts, parent=edge, arrow_length=9, arrow_tip_length=7, arrow_width=7, line_width=edge.width/2, stroke_color_rgba=stroke)
-    
-    #draw a label above the center of the line
+def ends(edge):
+    '''Return the (startx, starty, endx, endy) that paint would draw edge between.'''
+    return _adj_coords(edge)[:4]
+
+def _labels(edge, dx, dy):
+    '''Work out the text, position and angle of the labels above and below edge.'''
     center = edge.get_xyr()
-    text_color = edge.stylesheet.text_color
-    font = edge.stylesheet.text_fontdesc
     #the label field is a dict of three labels, each a list of [weight,text]
     label = edge.label
     origin = edge.origin.label
@@ -91,29 +78,111 @@ def paint(edge):
     
     bottext = 'Both '+label['bidir'][1] if label['bidir'] else '';
     
-    toplbl = GooCanvas.CanvasText(parent=edge, text=toptext, alignment="center", fill_color_rgba=text_color, font_desc=font, anchor=GooCanvas.CanvasAnchorType.SOUTH, x=topx, y=topy)
-    botlbl = GooCanvas.CanvasText(parent=edge, text=bottext, alignment="center", fill_color_rgba=text_color, font_desc=font, anchor=GooCanvas.CanvasAnchorType.NORTH, x=botx, y=boty)
-    
-    #rotate the label appropriately
-    toplbl.rotate(deg, topx, topy)
-    botlbl.rotate(deg, botx, boty)
+    return (toptext, topx, topy, bottext, botx, boty, deg)
 
-def show_selected(edge):
-    '''Draw a highlight outline around the edge.'''
+def paint(edge):
+    '''Draw lobj, an AggLine, as a simple line with text labels along its length.'''
     startx, starty, endx, endy, dx, dy = _adj_coords(edge)
     
     #construct the points
     pts = util.mkpoints([(startx, starty), (endx, endy)])
+    
+    #get style data from edge stylesheet
     sheet = edge.stylesheet
-    stroke = sheet.sel_color
-    width = edge.width/2 + sheet.sel_width*2
+    stroke = sheet.stroke_color
+    text_color = sheet.text_color
+    font = sheet.text_fontdesc
+    
+    #remember what we made and how, so update can change just what it has to
+    state = {'ends': (startx, starty, endx, endy), 'width': edge.width/2, 'arrows': (edge.start_arrow, edge.end_arrow)}
+    edge.shapes = {'detail': edge.detail, 'state': state}
+    
+    #at low zoom, leave out everything but the line
+    if edge.detail == 'dots':
+        edge.shapes['line'] = GooCanvas.CanvasPolyline(points=pts, parent=edge, line_width=1, line_width_is_unscaled=True, stroke_color_rgba=stroke)
+        return
+    if edge.detail == 'plain':
+        edge.shapes['line'] = GooCanvas.CanvasPolyline(points=pts, parent=edge, line_width=edge.width/2, stroke_color_rgba=stroke)
+        return
+    
+    #draw the line
+    edge.shapes['line'] = GooCanvas.CanvasPolyline(end_arrow=edge.end_arrow, start_arrow=edge.start_arrow, points=pts, parent=edge, arrow_length=9, arrow_tip_length=7, arrow_width=7, line_width=edge.width/2, stroke_color_rgba=stroke)
+    
+    #draw labels above and below the center of the line, rotated to follow it
+    toptext, topx, topy, bottext, botx, boty, deg = _labels(edge, dx, dy)
+    state['labels'] = (toptext, topx, topy, bottext, botx, boty, deg)
+    
+    toplbl = GooCanvas.CanvasText(parent=edge, text=toptext, alignment="center", fill_color_rgba=text_color, font_desc=font, anchor=GooCanvas.CanvasAnchorType.SOUTH, x=0, y=0)
+    botlbl = GooCanvas.CanvasText(parent=edge, text=bottext, alignment="center", fill_color_rgba=text_color, font_desc=font, anchor=GooCanvas.CanvasAnchorType.NORTH, x=0, y=0)
+    toplbl.set_simple_transform(topx, topy, 1, deg)
+    botlbl.set_simple_transform(botx, boty, 1, deg)
+    edge.shapes['top'] = toplbl
+    edge.shapes['bottom'] = botlbl
+
+def update(edge):
+    '''Bring what paint drew for edge up to date, only touching what changed.
+    Returns False if edge needs painting from scratch instead.'''
+    shapes = edge.shapes
+    if shapes is None or shapes['detail'] != edge.detail:
+        return False
     
-    arrow_len = 10*(edge.width/2)/width
-    arrow_tip_len = 7*(edge.width/2)/width
-    arrow_width = 9*(edge.width/2)/width
+    startx, starty, endx, endy, dx, dy = _adj_coords(edge)
+    old = shapes['state']
+    state = {'ends': (startx, starty, endx, endy), 'width': edge.width/2, 'arrows': (edge.start_arrow, edge.end_arrow)}
+    
+    line = shapes['line']
+    props = {}
+    if state['ends'] != old['ends']:
+        props['points'] = util.mkpoints([(startx, starty), (endx, endy)])
+    if edge.detail != 'dots' and state['width'] != old['width']:
+        props['line_width'] = state['width']
+    if edge.detail == 'full' and state['arrows'] != old['arrows']:
+        props['start_arrow'], props['end_arrow'] = state['arrows']
+    if props:
+        line.set_properties(**props)
+    
+    if edge.detail == 'full':
+        labels = _labels(edge, dx, dy)
+        state['labels'] = labels
+        toptext, topx, topy, bottext, botx, boty, deg = labels
+        otop, otopx, otopy, obot, obotx, oboty, odeg = old['labels']
+        
+        if toptext != otop:
+            shapes['top'].set_property('text', toptext)
+        if bottext != obot:
+            shapes['bottom'].set_property('text', bottext)
+        if (topx, topy, deg) != (otopx, otopy, odeg):
+            shapes['top'].set_simple_transform(topx, topy, 1, deg)
+        if (botx, boty, deg) != (obotx, oboty, odeg):
+            shapes['bottom'].set_simple_transform(botx, boty, 1, deg)
+    
+    #the highlight has to follow the line
+    if edge.selected and edge.selring is not None and state != old:
+        edge.selring.set_properties(**_highlight(edge, startx, starty, endx, endy))
+    
+    shapes['state'] = state
+    return True
+
+def _highlight(edge, startx, starty, endx, endy):
+    '''Return the properties of the highlight outline around edge.'''
+    sheet = edge.stylesheet
+    width = edge.width/2 + sheet.sel_width*2
+    arrows = edge.detail == 'full'
+    
+    return {'end_arrow': arrows and edge.end_arrow,
+            'start_arrow': arrows and edge.start_arrow,
+            'arrow_length': 10*(edge.width/2)/width,
+            'arrow_tip_length': 7*(edge.width/2)/width,
+            'arrow_width': 9*(edge.width/2)/width,
+            'points': util.mkpoints([(startx, starty), (endx, endy)]),
+            'line_width': width}
+
+def show_selected(edge):
+    '''Draw a highlight outline around the edge.'''
+    startx, starty, endx, endy, dx, dy = _adj_coords(edge)
     
     #draw the line
-    highlight = GooCanvas.CanvasPolyline(end_arrow=edge.end_arrow, start_arrow=edge.start_arrow, arrow_length=arrow_len, arrow_tip_length=arrow_tip_len, arrow_width=arrow_width, points=pts, parent=edge, line_width=width, stroke_color_rgba=stroke)
+    highlight = GooCanvas.CanvasPolyline(parent=edge, stroke_color_rgba=edge.stylesheet.sel_color, **_highlight(edge, startx, starty, endx, endy))
     highlight.lower(edge.get_child(0))
     
     return highlight
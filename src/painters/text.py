@@ -0,0 +1,86 @@
+'''
+   Copyright (c) 2012 Peter Andrews
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from gi.repository import Pango, PangoCairo
+from collections import OrderedDict
+from textwrap import TextWrapper
+
+class TextCache(object):
+    '''Remember wrapped labels and how big they are, so redrawing doesn't shape text again.
+    
+    Entries are keyed by the text along with the wrap width or font description,
+    and the least recently used ones are dropped once there are more than size.'''
+    
+    def __init__(self, size=1<<14):
+        '''Make an empty cache holding at most size entries.'''
+        self.size = size
+        self.entries = OrderedDict()
+        self.wrappers = {} #wrap width -> TextWrapper
+        self.context = None #pango context for laying text out without a canvas
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def wrap(self, text, width):
+        '''Return text wrapped to lines of at most width characters.'''
+        key = ('wrap', text, width)
+        found = self._get(key)
+        if found is not None:
+            return found
+        
+        wrapper = self.wrappers.get(width)
+        if wrapper is None:
+            wrapper = self.wrappers[width] = TextWrapper(width=width)
+        return self._put(key, wrapper.fill(text))
+    
+    def extents(self, text, fontdesc, alignment=Pango.Alignment.CENTER):
+        '''Return the (width, height) text takes up in fontdesc, in canvas units.'''
+        font = fontdesc.to_string() if fontdesc is not None else None
+        key = ('extents', text, font, int(alignment))
+        found = self._get(key)
+        if found is not None:
+            return found
+        
+        if self.context is None:
+            self.context = PangoCairo.FontMap.get_default().create_context()
+        layout = Pango.Layout(self.context)
+        layout.set_font_description(fontdesc)
+        layout.set_alignment(alignment)
+        layout.set_text(text, -1)
+        ink, logical = layout.get_pixel_extents()
+        return self._put(key, (logical.width, logical.height))
+    
+    def clear(self):
+        '''Forget everything, like after the fonts change.'''
+        self.entries.clear()
+    
+    def _get(self, key):
+        '''Look key up, marking it as just used.'''
+        value = self.entries.pop(key, None)
+        if value is None:
+            return None
+        
+        self.entries[key] = value
+        return value
+    
+    def _put(self, key, value):
+        '''Store value under key, making room if need be, and return it.'''
+        self.entries[key] = value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+cache = TextCache() #shared by the canvas and every painter
@@ -17,6 +17,8 @@
 from gi.repository import GooCanvas
 from gi.repository import Gdk
 
+from painters.text import cache
+
 def paint(vertex):
     '''Draw vertex as a box surrounding its (centered) label.'''
     #get style data from vertex stylesheet
@@ -26,17 +28,55 @@ def paint(vertex):
     text_color = vertex.stylesheet.text_color
     font = vertex.stylesheet.text_fontdesc
     
-    box = GooCanvas.CanvasRect(parent=vertex, stroke_color_rgba=stroke, fill_color_rgba=fill)
-    lbl = GooCanvas.CanvasText(parent=vertex, text=label, alignment="center", fill_color_rgba=text_color, font_desc=font)
+    if vertex.detail == 'dots':
+        #too small to read, so just a blob the same size as the box would be
+        props = measure(vertex)
+        blob = GooCanvas.CanvasRect(parent=vertex, width=props['width'], height=props['height'], line_width=0, fill_color_rgba=stroke)
+        vertex.shapes = {'detail': 'dots', 'box': blob, 'state': (label, props['width'])}
+        return props
     
-    lbl_bounds = lbl.get_bounds()
-    lw = lbl_bounds.x2 - lbl_bounds.x1
-    lh = lbl_bounds.y2 - lbl_bounds.y1
+    box = GooCanvas.CanvasRect(parent=vertex, stroke_color_rgba=stroke, fill_color_rgba=fill)
+    lw, lh = cache.extents(label, font)
     biggest = lw if lw > lh else lh
     
-    lbl.set_properties(x=10+(biggest-lw)/2, y=10+(biggest-lh)/2)
+    lbl = GooCanvas.CanvasText(parent=vertex, text=label, alignment="center", fill_color_rgba=text_color, font_desc=font, x=10+(biggest-lw)/2, y=10+(biggest-lh)/2)
     box.set_properties(width=biggest+20, height=biggest+20)
     
+    #remember what we made and how, so update can change just what it has to
+    vertex.shapes = {'detail': 'full', 'box': box, 'label': lbl, 'state': (label, biggest+20)}
+    
+    props = {'width': biggest+20, 'height': biggest+20}
+    return props
+
+def update(vertex):
+    '''Bring what paint drew for vertex up to date, only touching what changed.
+    Returns the same as paint, or None if vertex needs painting from scratch instead.'''
+    shapes = vertex.shapes
+    if shapes is None or shapes['detail'] != ('dots' if vertex.detail == 'dots' else 'full'):
+        return None
+    
+    label = vertex.text
+    lw, lh = cache.extents(label, vertex.stylesheet.text_fontdesc)
+    biggest = lw if lw > lh else lh
+    size = biggest+20
+    
+    old_label, old_size = shapes['state']
+    if size != old_size:
+        shapes['box'].set_properties(width=size, height=size)
+    if 'label' in shapes and (label, size) != shapes['state']:
+        props = {'x': 10+(biggest-lw)/2, 'y': 10+(biggest-lh)/2}
+        if label != old_label: props['text'] = label
+        shapes['label'].set_properties(**props)
+    shapes['state'] = (label, size)
+    
+    props = {'width': size, 'height': size}
+    return props
+
+def measure(vertex):
+    '''Work out the size paint would give vertex, without drawing anything.'''
+    lw, lh = cache.extents(vertex.text, vertex.stylesheet.text_fontdesc)
+    biggest = lw if lw > lh else lh
+    
     props = {'width': biggest+20, 'height': biggest+20}
     return props
 
@@ -18,7 +18,7 @@
 
 #import system libraries
 from __future__ import division
-from gi.repository import Gtk, GooCanvas, Gdk
+from gi.repository import Gtk, GooCanvas, Gdk, GObject
 import networkx as nx
 import xml.etree.ElementTree as et
 from time import time
@@ -40,6 +40,7 @@ class Sociogram(object):
         self.selection = None
         self.seltype = None
         self.seldata = None
+        self.group = [] #vertices caught by a rubber band selection, besides self.selection
         self.highlight_dist = 1
         self.highlight = False
         self.savepath = None
@@ -134,10 +135,14 @@ class Sociogram(object):
         #attach callbacks
         self.canvas.node_callback = self.node_clicked
         self.canvas.line_callback = self.line_clicked
+        self.canvas.band_callback = self.band_selected
         self.canvas.key_handler = self.canvas_key_handler
         self.canvas.connect("button-press-event", self.canvas_clicked)
         self.canvas.connect("scroll-event", self.scroll_handler)
         self.canvas.mouseover_callback = self.update_pointer
+        self.canvas.layout_callback = self.layout_state
+        self.canvas.build_callback = self.build_state
+        self.canvas.move_callback = self.node_moved
         
         #TODO once the prefs dialog is implemented, this should be moved to a separate default style update function
         #populate our default styling
@@ -205,6 +210,11 @@ class Sociogram(object):
         
         self.hscroll = self.builder.get_object("horiz_scroll_adj")
         self.vscroll = self.builder.get_object("vertical_scroll_adj")
+        
+        #big documents only put what's on screen on the canvas, so it needs to know when that changes
+        for adj in (self.hscroll, self.vscroll):
+            adj.connect("value-changed", self.canvas.update_view)
+            adj.connect("changed", self.canvas.update_view)
         self.scale_adj = self.builder.get_object("scale_adj")
         self.load_err_dlg = self.builder.get_object("load_err_dlg")
         self.settings_warning = self.builder.get_object("load_settings_warning")
@@ -214,6 +224,14 @@ class Sociogram(object):
         self.desc_view = self.builder.get_object("desc_view")
         self.desc_undo_btn = self.builder.get_object("desc_undo")
         self.desc_redo_btn = self.builder.get_object("desc_redo")
+        self.statusbar = self.builder.get_object("statusbar")
+        #layout engine menu items, by engine name
+        self.engine_items = {None: self.builder.get_object("engine_auto"),
+                             'spring': self.builder.get_object("engine_spring"),
+                             'barneshut': self.builder.get_object("engine_barneshut"),
+                             'pivotmds': self.builder.get_object("engine_pivotmds")}
+        self.layout_msg = self.statusbar.get_context_id("layout")
+        self.build_msg = self.statusbar.get_context_id("build")
         
         #set our version string
         self.builder.get_object("about_dlg").set_version(self.version)
@@ -280,7 +298,9 @@ class Sociogram(object):
             "data.delattr": self.del_attr,
             "data.updateattr": self.show_dev_error,
             "graph.toggle_highlight": self.toggle_highlight,
-            "graph.refresh": self.redraw
+            "graph.refresh": self.relayout,
+            "graph.stop_layout": self.stop_layout,
+            "graph.set_engine": self.pick_engine
         }
         self.builder.connect_signals(handlers_main)
         
@@ -442,6 +462,7 @@ class Sociogram(object):
         self.update_title()
         self.set_doc_title(None)
         self.set_doc_desc(None)
+        self.set_engine(None)
         
         self.zoom_reset()
         self.G.clear()
@@ -460,105 +481,143 @@ class Sociogram(object):
         open_dlg.hide()
         
         if response == 5:
-            #clear existing data
-            self.set_dirty(False) #prevent another prompt
-            self.make_new()
-            
-            self.savepath = open_dlg.get_filename()
-            self.update_title()
+            #clearing and loading should show up as one change, not several
+            self.canvas.freeze()
             try:
-                tree = et.parse(self.savepath)
-            except ParseError:
-                self.load_err_dlg.run()
-                self.load_err_dlg.hide()
+                #clear existing data
+                self.set_dirty(False) #prevent another prompt
                 self.make_new()
-                return
-            
-            root = tree.getroot()
-            
-            err = None
-            
-            if self.version != root.get('version'):
-                #TODO figure out how to compare save format versions
-                #err = "version"
-                pass
-            
-            try:
-                #import doc title and description
-                title = root.find('title').text
-                desc = root.find('description').text
-                self.set_doc_title(title)
-                self.set_doc_desc(desc)
                 
-                #import document-specific settings
-                settings = root.find('settings')
-                scale = settings.find('scale').text
-                self.scale_adj.set_value(float(scale))
-                sortprefs = settings.find('attrsort')
-                sortdir = Gtk.SortType.ASCENDING if sortprefs.get('direction') == "asc" else Gtk.SortType.DESCENDING
-                sortcol = int(sortprefs.text)
-                self.attr_store.set_sort_column_id(sortcol, sortdir)
-            except AttributeError:
-                err = "settings"
-            
-            try:
-                #import document data
-                data = root.find('data')
-                for node in data.iter('node'):
-                    #add node
-                    uid = node.find('uid').text
-                    label = node.find('label').text
-                    notes = node.find('notes').text
-                    
-                    #construct attributes list
-                    attrs = []
-                    for a in node.iter('attr'):
-                        name = a.find('name').text
-                        val = a.find('value').text
-                        vis = True if a.find('visible').text == "True" else False
-                        u = a.find('uid').text
-                        attrs.append((name, val, vis, u))
-                    
-                    self._add_node(label, uid=uid, attrs=attrs, notes=notes)
-                
-                for edge in data.iter('rel'):
-                    #add edge
-                    uid = edge.find('uid').text
-                    label = edge.find('label').text
-                    notes = edge.find('notes').text
-                    
-                    #construct attributes list
-                    attrs = []
-                    for a in edge.iter('attr'):
-                        name = a.find('name').text
-                        val = a.find('value').text
-                        vis = True if a.find('visible').text == "True" else False
-                        u = a.find('uid').text
-                        attrs.append((name, val, vis, u))
-                    
-                    origin = edge.find('origin').text
-                    dest = edge.find('dest').text
-                    mutual = True if edge.find('mutual').text == "True" else False
-                    weight = int(float(edge.find('weight').text))
-                    
-                    self._add_rel(label, origin, dest, weight, mutual, attrs=attrs, uid=uid, notes=notes)
-            except AttributeError:
-                err = "all"
-            
-            if err is not None:
-                if err is "all":
+                self.savepath = open_dlg.get_filename()
+                self.update_title()
+                try:
+                    tree = et.parse(self.savepath)
+                except ParseError:
+                    self.canvas.thaw()
                     self.load_err_dlg.run()
                     self.load_err_dlg.hide()
+                    self.canvas.freeze()
                     self.make_new()
                     return
+                
+                root = tree.getroot()
+                
+                err = None
+                
+                if self.version != root.get('version'):
+                    #TODO figure out how to compare save format versions
+                    #err = "version"
+                    pass
+                
+                try:
+                    #import doc title and description
+                    title = root.find('title').text
+                    desc = root.find('description').text
+                    self.set_doc_title(title)
+                    self.set_doc_desc(desc)
                     
-                if err is "settings":
-                    self.settings_warning.run()
-                    self.settings_warning.hide()
-            
-            self.redraw()        
-            self.builder.get_object("canvas_eventbox").grab_focus()
-            #TODO send "opened" message through status bar
+                    #import document-specific settings
+                    settings = root.find('settings')
+                    scale = settings.find('scale').text
+                    self.scale_adj.set_value(float(scale))
+                    sortprefs = settings.find('attrsort')
+                    sortdir = Gtk.SortType.ASCENDING if sortprefs.get('direction') == "asc" else Gtk.SortType.DESCENDING
+                    sortcol = int(sortprefs.text)
+                    self.attr_store.set_sort_column_id(sortcol, sortdir)
+                    #layout engine is optional, and defaults to automatic
+                    engine = settings.find('layout')
+                    if engine is not None and engine.text in self.engine_items:
+                        self.set_engine(engine.text)
+                except AttributeError:
+                    err = "settings"
+                
+                #saved positions, if the file has them
+                locations = {}
+                offsets = {}
+                
+                try:
+                    #import document data
+                    data = root.find('data')
+                    for node in data.iter('node'):
+                        #add node
+                        uid = node.find('uid').text
+                        label = node.find('label').text
+                        notes = node.find('notes').text
+                        
+                        #construct attributes list
+                        attrs = []
+                        for a in node.iter('attr'):
+                            name = a.find('name').text
+                            val = a.find('value').text
+                            vis = True if a.find('visible').text == "True" else False
+                            u = a.find('uid').text
+                            attrs.append((name, val, vis, u))
+                        
+                        self._add_node(label, uid=uid, attrs=attrs, notes=notes)
+                        
+                        pos = node.find('pos')
+                        if pos is not None:
+                            try:
+                                locations[label] = (int(pos.get('component')), float(pos.get('x')), float(pos.get('y')))
+                            except (TypeError, ValueError):
+                                pass
+                    
+                    for edge in data.iter('rel'):
+                        #add edge
+                        uid = edge.find('uid').text
+                        label = edge.find('label').text
+                        notes = edge.find('notes').text
+                        
+                        #construct attributes list
+                        attrs = []
+                        for a in edge.iter('attr'):
+                            name = a.find('name').text
+                            val = a.find('value').text
+                            vis = True if a.find('visible').text == "True" else False
+                            u = a.find('uid').text
+                            attrs.append((name, val, vis, u))
+                        
+                        origin = edge.find('origin').text
+                        dest = edge.find('dest').text
+                        mutual = True if edge.find('mutual').text == "True" else False
+                        weight = int(float(edge.find('weight').text))
+                        
+                        self._add_rel(label, origin, dest, weight, mutual, attrs=attrs, uid=uid, notes=notes)
+                    
+                    for comp in data.iter('component'):
+                        try:
+                            offsets[int(comp.get('id'))] = (float(comp.get('x')), float(comp.get('y')))
+                        except (TypeError, ValueError):
+                            pass
+                except AttributeError:
+                    err = "all"
+                
+                if err is not None:
+                    #dialogs need the window behind them painting
+                    if err is "all":
+                        self.canvas.thaw()
+                        self.load_err_dlg.run()
+                        self.load_err_dlg.hide()
+                        self.canvas.freeze()
+                        self.make_new()
+                        return
+                        
+                    if err is "settings":
+                        self.canvas.thaw()
+                        self.settings_warning.run()
+                        self.settings_warning.hide()
+                        self.canvas.freeze()
+                
+                if locations:
+                    #skip layout entirely for whatever the file already placed
+                    self.canvas.scroll_to(0, 0)
+                    self.canvas.restore(self.G, locations, offsets)
+                else:
+                    self.redraw()
+                self.builder.get_object("canvas_eventbox").grab_focus()
+                #TODO send "opened" message through status bar
+            finally:
+                self.canvas.thaw()
     
     def save(self, widget=None, data=None):
         '''Event handler and standalone. Save to known path.'''
@@ -583,14 +642,17 @@ class Sociogram(object):
         sortdir = "asc" if sortdir == Gtk.SortType.ASCENDING else 'desc'
         sortset = sub(settings, 'attrsort', sortcol)
         sortset.set('direction', sortdir)
+        engine = self.canvas.layout_engine
+        sub(settings, 'layout', 'auto' if engine is None else engine)
         
         #create data holder
         data = sub(root, 'data')
+        locations, offsets = self.canvas.get_layout()
         #create nodes
         for node in self.G.nodes_iter():
             n = self.G.node[node]['node']
             node = sub(data, 'node')
-            #store uid, label, notes, attributes
+            #store uid, label, notes, attributes, position
             sub(node, 'uid', n.uid)
             sub(node, 'label', n.label)
             sub(node, 'notes', n.notes)
@@ -600,6 +662,12 @@ class Sociogram(object):
                 sub(attr, 'name', aval['name'])
                 sub(attr, 'value', aval['value'])
                 sub(attr, 'visible', aval['visible'])
+            if n.label in locations:
+                cid, x, y = locations[n.label]
+                pos = sub(node, 'pos')
+                pos.set('component', str(cid))
+                pos.set('x', str(float(x)))
+                pos.set('y', str(float(y)))
         
         for f, t in self.G.edges_iter():
             for e in self.G[f][t]['rels']:
@@ -619,6 +687,13 @@ class Sociogram(object):
                 sub(edge, 'weight', e.weight)
                 sub(edge, 'mutual', e.mutual)
         
+        #store where each component was packed
+        for cid, (x, y) in offsets.iteritems():
+            comp = sub(data, 'component')
+            comp.set('id', str(cid))
+            comp.set('x', str(float(x)))
+            comp.set('y', str(float(y)))
+        
         #write xml to self.savepath
         tree = et.ElementTree(element=root)
         tree.write(self.savepath, encoding="UTF-8")
@@ -783,12 +858,11 @@ class Sociogram(object):
                 #this is the normal case
                 self.redraw()
                 
+                #a big drawing might not have been built as far as the new item yet
                 if "Rel" in obj_type:
-                    obj = self.canvas.get_edge(fnode, tnode) #get proper edge
+                    self.canvas.when_built(self._select_edge, fnode, tnode)
                 else:
-                    obj = self.canvas.get_vertex(lbl) #get proper node
-                
-                self.set_selection(obj)
+                    self.canvas.when_built(self._select_node, lbl)
             
             self.set_dirty(True)
             
@@ -902,12 +976,25 @@ class Sociogram(object):
             widget.set_icon_tooltip_text(Gtk.EntryIconPosition.SECONDARY, _("No such node"))
             widget.set_icon_activatable(Gtk.EntryIconPosition.SECONDARY, False)
         else:
-            #select node
-            vertex = self.canvas.get_vertex(node)
-            self.set_selection(vertex)
-            self.center_on(vertex)
+            #a big drawing might not have been built as far as it yet
+            self.canvas.when_built(self._select_node, node)
         widget.select_region(0, widget.get_text_length())
     
+    def _select_edge(self, fnode, tnode):
+        '''Canvas callback. Select the edge between nodes fnode and tnode, if it's drawn.'''
+        self.set_selection(self.canvas.get_edge(fnode, tnode))
+    
+    def _select_node(self, lbl):
+        '''Canvas callback. Select the vertex for node lbl and center on it, if it's drawn.'''
+        vertex = self.canvas.get_vertex(lbl)
+        
+        #stopping a big drawing early can leave it out
+        if vertex is None:
+            return
+        
+        self.set_selection(vertex)
+        self.center_on(vertex)
+    
     def set_search_icon(self, widget, data=None):
         '''Event handler. Resets search box icon when user types.'''
         widget.set_icon_from_stock(Gtk.EntryIconPosition.SECONDARY, Gtk.STOCK_FIND)
@@ -1001,10 +1088,22 @@ class Sociogram(object):
             self.attr_store.clear()
             self.rel_store.clear()
         
+        for v in self.group:
+            v.set_selected(False)
+        self.group = []
+        
         self.disable_all_controls()
     
     def delete_selection(self, widget=None, data=None):
-        '''Event handler and standalone. Delete selected object.'''
+        '''Event handler and standalone. Delete selected object, or every node in a band selection.'''
+        if self.group:
+            for v in self.group:
+                self.G.remove_node(v.label)
+            self.clear_select()
+            self.redraw()
+            self.set_dirty(True)
+            return
+        
         if self.selection == None:
             return
         
@@ -1116,6 +1215,23 @@ class Sociogram(object):
             self.show_dev_error()
             #use menu.popup function
     
+    def band_selected(self, vertices):
+        '''Canvas callback. Select the vertices caught by a rubber band.
+        A lone vertex gets the edit controls like a click would; several are just marked.'''
+        if len(vertices) == 1:
+            self.set_selection(vertices[0])
+            return
+        
+        self.clear_select()
+        for v in vertices:
+            v.set_selected(True)
+        self.group = vertices
+        
+        #deleting is the only action that works on a group so far
+        self.builder.get_object("del").set_sensitive(True)
+        self.builder.get_object("menu_delete").set_sensitive(True)
+        self.builder.get_object("canvas_eventbox").grab_focus() #set keyboard focus
+    
     def canvas_clicked(self, canvas, obj=None, event=None):
         '''Event handler. Set keyboard focus and clear selection on canvas click.'''
         self.clear_select()
@@ -1210,7 +1326,7 @@ class Sociogram(object):
         vis_w = self.hscroll.get_page_size()
         vis_h = self.vscroll.get_page_size()
         
-        #add padding to the graph width and height to account for invisible spacing rings
+        #add a little padding around the graph
         bounds = self.canvas.get_bounds()
         graph_w = bounds.x2 - bounds.x1 + 20
         graph_h = bounds.y2 - bounds.y1 + 20
@@ -1440,9 +1556,15 @@ class Sociogram(object):
         self.not_implemented_box.run()
         self.not_implemented_box.hide()
     
-    def redraw(self, widget=None, data=None):
-        '''Event handler and standalone. Trigger a graph update and redraw.'''
+    def relayout(self, widget=None, data=None):
+        '''Event handler and standalone. Redraw with a completely new layout.'''
+        self.redraw(full=True)
+    
+    def redraw(self, widget=None, data=None, full=False):
+        '''Event handler and standalone. Trigger a graph update and redraw.
+        Only changed components get a new layout unless full is set.'''
         seltype = None
+        lbl = rel = tlbl = flbl = None
         if self.seltype == 'node':
             seltype = 'node'
             lbl = self.seldata.label
@@ -1454,25 +1576,77 @@ class Sociogram(object):
             flbl = self.seldata.from_node
         
         self.canvas.scroll_to(0, 0)
-        self.canvas.redraw(self.G)
+        self.canvas.redraw(self.G, full)
         
         #reset the cursor
         rwin = self.builder.get_object("canvas_eventbox").get_window()
         rwin.set_cursor(None)
         
-        #get back our selection
+        #get back our selection, once a big drawing has been built as far as it
         if seltype != None:
-            if seltype == 'node':
-                self.set_selection(self.canvas.get_vertex(lbl))
-            else:
-                self.set_selection(self.canvas.get_edge(tlbl, flbl))
-                if rel in self.selection.rels:
-                    num = self.selection.rels.index(rel)
-                    self.pick_rel(relnum = num)
-                    self.builder.get_object("rel_combo").set_active(num)
-            
-            #center the selection
-            self.center_on(self.selection)
+            self.clear_select()
+            self.canvas.when_built(self._reselect, seltype, lbl, tlbl, flbl, rel)
+    
+    def _reselect(self, seltype, lbl, tlbl, flbl, rel):
+        '''Canvas callback. Select what was selected before a redraw, and center on it.'''
+        if seltype == 'node':
+            self.set_selection(self.canvas.get_vertex(lbl))
+        else:
+            self.set_selection(self.canvas.get_edge(tlbl, flbl))
+        
+        #stopping a big drawing early can leave it out
+        if self.selection == None:
+            return
+        
+        if seltype == 'edge' and rel in self.selection.rels:
+            num = self.selection.rels.index(rel)
+            self.pick_rel(relnum = num)
+            self.builder.get_object("rel_combo").set_active(num)
+        
+        #center the selection
+        self.center_on(self.selection)
+    
+    def pick_engine(self, widget, data=None):
+        '''Event handler. Switch to the layout engine chosen from the menu and lay out again.'''
+        if not widget.get_active(): return
+        
+        for name, item in self.engine_items.iteritems():
+            if item is widget: break
+        
+        if name == self.canvas.layout_engine: return
+        
+        self.set_engine(name)
+        self.set_dirty(True)
+        self.relayout()
+    
+    def set_engine(self, name):
+        '''Set the document's layout engine by name, or None to choose automatically.'''
+        self.canvas.layout_engine = name
+        self.engine_items[name].set_active(True)
+    
+    def stop_layout(self, widget=None, data=None):
+        '''Event handler and standalone. Stop drawing a big graph, keeping what's drawn,
+        and leave the layout as it is now instead of refining it further.'''
+        self.canvas.cancel_build()
+        self.canvas.cancel_layout()
+    
+    def layout_state(self, running):
+        '''Callback. Show whether the canvas is refining a layout in the background.'''
+        self.builder.get_object("menu_stop_layout").set_sensitive(running or self.canvas.build is not None)
+        self.statusbar.remove_all(self.layout_msg)
+        if running:
+            self.statusbar.push(self.layout_msg, _("Refining layout..."))
+    
+    def build_state(self, done):
+        '''Callback. Show how much of a big graph the canvas has drawn, or None once it's finished.'''
+        self.builder.get_object("menu_stop_layout").set_sensitive(done is not None or self.canvas.run is not None)
+        self.statusbar.remove_all(self.build_msg)
+        if done is not None:
+            self.statusbar.push(self.build_msg, _("Drawing... %d%%") % int(100*done))
+    
+    def node_moved(self, vertex):
+        '''Callback. A node was dragged somewhere new, and that's worth saving.'''
+        self.set_dirty(True)
     
     def refresh(self, touch, oldlbl=None):
         '''Redraw the diagram without updating node positions.'''
@@ -1491,5 +1665,6 @@ def main():
     return
 
 if __name__ == "__main__":
+    GObject.threads_init() #layouts report back from a worker thread
     soc = Sociogram()
     main()